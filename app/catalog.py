@@ -0,0 +1,248 @@
+from array import array
+from decimal import Decimal, ROUND_HALF_UP
+from operator import mul
+from typing import Dict, Iterable
+
+from app.eshop import carted_product_names, price_changed
+from app.inventory import inventory
+
+CENT = Decimal('0.01')
+EMPTY = -1
+
+
+class ProductView:
+    """Легке представлення товару з каталогу — зберігає лише посилання та індекс."""
+
+    __slots__ = ('_catalog', '_index')
+
+    def __init__(self, catalog, index):
+        self._catalog = catalog
+        self._index = index
+
+    @property
+    def name(self):
+        return self._catalog.name_at(self._index)
+
+    @property
+    def price(self):
+        return self._catalog.prices[self._index]
+
+    @price.setter
+    def price(self, value):
+        self._catalog.prices[self._index] = value
+        price_changed(self.name)
+
+    @property
+    def available_amount(self):
+        return self._catalog.amounts[self._index]
+
+    @available_amount.setter
+    def available_amount(self, value):
+        self._catalog.set_amount(self._index, value)
+
+    def is_available(self, requested_amount):
+        """Перевірити, чи доступна вказана кількість товару."""
+        return self.available_amount >= requested_amount
+
+    def buy(self, requested_amount):
+        """Списати товар після купівлі — атомарно, без продажу понад залишок."""
+        inventory.buy(self, requested_amount)
+
+    def __eq__(self, other):
+        """Порівняння за назвою — сумісне з Product."""
+        return self.name == other.name
+
+    def __ne__(self, other):
+        """Нерівність продуктів."""
+        return self.name != other.name
+
+    def __hash__(self):
+        """Той самий хеш, що й у Product, тож їх можна змішувати у кошику."""
+        return hash(self.name)
+
+    def __str__(self):
+        """Текстове представлення продукту."""
+        return self.name
+
+    def __repr__(self):
+        return f"ProductView({self.name!r}, price={self.price}, available_amount={self.available_amount})"
+
+
+class Catalog:
+    """Каталог товарів у колонкових масивах.
+
+    Ціни та залишки зберігаються у масивах ``array``, назви — одним буфером
+    UTF-8 з масивом зміщень, а індекс за назвою — хеш-таблицею з відкритою
+    адресацією у масиві ``int32``. Жодного Python-об'єкта на товар не
+    лишається: замість нього видаються ``ProductView`` зі ``__slots__``. Якщо
+    до каталогу підключено ``InventoryJournal``, кожна зміна залишку
+    дописується в журнал.
+    """
+
+    def __init__(self):
+        """Створити порожній каталог."""
+        self.prices = array('d')
+        self.amounts = array('q')
+        self._names = bytearray()
+        # назва товару i — це _names[_offsets[i]:_offsets[i + 1]]; uint32 обмежує буфер 4 ГБ
+        self._offsets = array('I', [0])
+        # комірки хеш-таблиці містять індекс товару або EMPTY; заповнення не більше половини
+        self._slots = array('i', [EMPTY]) * 8
+        self.journal = None
+
+    def name_at(self, index):
+        """Назва товару за індексом."""
+        return self._names[self._offsets[index]:self._offsets[index + 1]].decode('utf-8')
+
+    def _find(self, key: bytes):
+        # (комірка, індекс товару або EMPTY) для закодованої назви — лінійне зондування
+        slots, names, offsets = self._slots, self._names, self._offsets
+        mask = len(slots) - 1
+        slot = hash(key) & mask
+        while True:
+            index = slots[slot]
+            if index == EMPTY or names[offsets[index]:offsets[index + 1]] == key:
+                return slot, index
+            slot = (slot + 1) & mask
+
+    def _lookup(self, name):
+        if not isinstance(name, str):
+            return EMPTY
+        return self._find(name.encode('utf-8'))[1]
+
+    def _grow(self):
+        names, offsets = self._names, self._offsets
+        self._slots = array('i', [EMPTY]) * (2 * len(self._slots))
+        for index in range(len(self.prices)):
+            slot, _ = self._find(bytes(names[offsets[index]:offsets[index + 1]]))
+            self._slots[slot] = index
+
+    @classmethod
+    def from_columns(cls, names: Iterable[str], prices: Iterable[float], amounts: Iterable[int]):
+        """Завантажити каталог одразу з колонок."""
+        catalog = cls()
+        for name, price, amount in zip(names, prices, amounts):
+            catalog.add(name, price, amount)
+        return catalog
+
+    def add(self, name, price, available_amount):
+        """Додати товар до каталогу з тими ж перевірками, що й у Product."""
+        if not name or price is None or available_amount is None:
+            raise ValueError("Invalid product attributes")
+        if price < 0 or available_amount < 0:
+            raise ValueError("Negative price or amount not allowed")
+        key = name.encode('utf-8')
+        slot, index = self._find(key)
+        if index != EMPTY:
+            raise ValueError(f"Product {name} is already in catalog")
+
+        index = len(self.prices)
+        self.prices.append(price)
+        self.amounts.append(available_amount)
+        self._names += key
+        self._offsets.append(len(self._names))
+        self._slots[slot] = index
+        if 2 * len(self.prices) > len(self._slots):
+            self._grow()
+        return ProductView(self, index)
+
+    def __len__(self):
+        return len(self.prices)
+
+    def __contains__(self, name):
+        return self._lookup(name) != EMPTY
+
+    def __getitem__(self, name):
+        return ProductView(self, self.index_of(name))
+
+    def __iter__(self):
+        return (ProductView(self, index) for index in range(len(self.prices)))
+
+    def get(self, name, default=None):
+        """Отримати товар за назвою або ``default``."""
+        index = self._lookup(name)
+        return default if index == EMPTY else ProductView(self, index)
+
+    def index_of(self, name):
+        """Індекс товару у колонках."""
+        index = self._lookup(name)
+        if index == EMPTY:
+            raise KeyError(name)
+        return index
+
+    def set_amount(self, index, amount):
+        """Встановити залишок товару за індексом і записати зміну в журнал."""
+        delta = amount - self.amounts[index]
+        self.amounts[index] = amount
+        if self.journal is not None:
+            self.journal.append(index, delta, amount)
+
+    def restock(self, amounts: Dict[str, int]):
+        """Поповнити залишки кількох товарів за один прохід."""
+        indexes = [(self.index_of(name), amount) for name, amount in amounts.items()]
+        if any(amount < 0 for _, amount in indexes):
+            raise ValueError("Restock amount cannot be negative")
+        for index, amount in indexes:
+            # під локом рушія, щоб не загубити паралельну покупку того ж товару
+            inventory.restock(ProductView(self, index), amount)
+
+    def reprice(self, prices: Dict[str, float]):
+        """Встановити нові ціни для кількох товарів."""
+        indexes = [(self.index_of(name), price) for name, price in prices.items()]
+        if any(price < 0 for _, price in indexes):
+            raise ValueError("Negative price not allowed")
+        for index, price in indexes:
+            self.prices[index] = price
+        price_changed(*prices)
+
+    def reprice_all(self, factor: float):
+        """Змінити всі ціни в ``factor`` разів одним проходом по колонці."""
+        if factor < 0:
+            raise ValueError("Negative price not allowed")
+        # map з вбудованим множенням проходить колонку в C, без байткоду на кожен товар
+        self.prices = array('d', map(float(factor).__mul__, self.prices))
+        # змінилися всі ціни, але перерахунку потребують лише товари, що лежать у кошиках
+        price_changed(*(name for name in carted_product_names() if name in self))
+
+    def stock_value(self):
+        """Загальна вартість усіх залишків."""
+        return sum(map(mul, self.prices, self.amounts))
+
+    def price_carts(self, carts):
+        """Порахувати суми багатьох кошиків за поточними цінами каталогу.
+
+        Рядки всіх кошиків збираються у дві колонки (ключ ціни та кількість),
+        потрібні ціни колонки переводяться у Decimal один раз на товар для
+        всіх кошиків, а добутки й суми рахуються через ``map`` над колонками.
+        Суми рахуються у Decimal й округлюються до копійки (ROUND_HALF_UP), а
+        повертаються float, як і ``ShoppingCart.calculate_total``. Товари поза
+        каталогом рахуються за власною ціною.
+        """
+        keys = array('q')
+        amounts = array('q')
+        ends = []
+        decimal_prices = {}
+        for cart in carts:
+            for product, amount in cart.products.items():
+                if type(product) is ProductView and product._catalog is self:  # pylint: disable=protected-access
+                    index = product._index  # pylint: disable=protected-access
+                else:
+                    index = self._lookup(product.name)
+                if index == EMPTY:
+                    # товари поза каталогом отримують від'ємні ключі зі своєю ціною
+                    index = -1 - len(decimal_prices)
+                    decimal_prices[index] = Decimal(str(product.price))
+                keys.append(index)
+                amounts.append(amount)
+            ends.append(len(keys))
+
+        indexes = sorted(set(keys) - set(decimal_prices))
+        decimal_prices.update(zip(indexes, map(Decimal, map(repr, map(self.prices.__getitem__, indexes)))))
+        line_totals = list(map(mul, map(decimal_prices.__getitem__, keys), amounts))
+
+        totals = []
+        start = 0
+        for end in ends:
+            totals.append(float(sum(line_totals[start:end], Decimal(0)).quantize(CENT, rounding=ROUND_HALF_UP)))
+            start = end
+        return totals
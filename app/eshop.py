@@ -1,8 +1,39 @@
-from typing import Dict
-from dataclasses import dataclass
+from __future__ import annotations
+
+import threading
+import weakref
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Tuple
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
-import uuid
-from services import ShippingService
+from decimal import Decimal
+from app.ids import new_order_id
+from app.inventory import inventory
+
+if TYPE_CHECKING:
+    # лише для анотацій — імпорт сервісів тягне boto3, а кошику він не потрібен
+    from services import ShippingService
+
+# назва товару -> {кошик: товар у цьому кошику}; зміна ціни зачіпає лише кошики з цим товаром
+_carts_by_name: Dict[str, weakref.WeakKeyDictionary] = {}
+_carts_lock = threading.Lock()
+
+
+def price_changed(*names):
+    """Позначити, що ціни товарів з такими назвами змінилися.
+
+    Кошики, в яких вони лежать, оновлять лише ці рядки при наступному
+    calculate_total; решта кошиків нічого не перераховує.
+    """
+    with _carts_lock:
+        for name in names:
+            for cart, product in list(_carts_by_name.get(name, {}).items()):
+                cart._stale.add(product)  # pylint: disable=protected-access
+
+
+def carted_product_names():
+    """Назви товарів, які зараз лежать хоча б в одному кошику."""
+    with _carts_lock:
+        return list(_carts_by_name)
 
 
 class Product:
@@ -19,16 +50,25 @@ class Product:
             raise ValueError("Negative price or amount not allowed")
 
         self.name = name
-        self.price = price
+        self._price = price
         self.available_amount = available_amount
 
+    @property
+    def price(self):
+        return self._price
+
+    @price.setter
+    def price(self, value):
+        self._price = value
+        price_changed(self.name)
+
     def is_available(self, requested_amount):
         """Перевірити, чи доступна вказана кількість товару."""
         return self.available_amount >= requested_amount
 
     def buy(self, requested_amount):
-        """Списати товар після купівлі."""
-        self.available_amount -= requested_amount
+        """Списати товар після купівлі — атомарно, без продажу понад залишок."""
+        inventory.buy(self, requested_amount)
 
     def __eq__(self, other):
         """Порівняння продуктів за назвою."""
@@ -47,6 +87,16 @@ class Product:
         return self.name
 
 
+@dataclass
+class CartLineResult:
+    """Результат додавання одного рядка у ShoppingCart.add_products."""
+
+    product: Product
+    amount: int
+    added: bool
+    error: Optional[str] = None
+
+
 class ShoppingCart:
 
     products: Dict[Product, int]
@@ -54,14 +104,28 @@ class ShoppingCart:
     def __init__(self):
         """Ініціалізація порожнього кошика."""
         self.products = {}
+        self._unit_prices: Dict[Product, Decimal] = {}
+        self._total = Decimal(0)
+        # товари, ціна яких змінилася після того, як їх рядок порахували
+        self._stale = set()
 
     def contains_product(self, product):
         """Перевірити, чи є товар у кошику."""
         return product in self.products
 
     def calculate_total(self):
-        """Обчислити загальну вартість товарів у кошику."""
-        return sum(p.price * count for p, count in self.products.items())
+        """Обчислити загальну вартість товарів у кошику.
+
+        Сума ведеться при змінах кошика, тож виклик коштує O(1). Якщо відтоді
+        змінилася ціна товарів цього кошика, спершу заново підтягуються лише
+        їхні рядки — сума завжди відповідає поточним цінам.
+        """
+        if self._stale:
+            with _carts_lock:
+                stale, self._stale = self._stale, set()
+            for product in stale:
+                self.update_price(product)
+        return float(self._total)
 
     def add_product(self, product: Product, amount: int):
         """Додати товар до кошика, якщо його достатньо на складі."""
@@ -69,20 +133,115 @@ class ShoppingCart:
             raise ValueError("Amount must be a positive integer")
         if not product.is_available(amount):
             raise ValueError(f"Product {product} has only {product.available_amount} items")
-        self.products[product] = amount
+        self._set_line(product, amount)
+
+    def add_products(self, lines: Iterable[Tuple[Product, int]]):
+        """Додати багато рядків за один прохід і повернути звіт по кожному рядку.
+
+        Рядки з помилкою не додаються, але й не переривають імпорт — замість
+        винятку помилка потрапляє у звіт. Повторний рядок того ж товару
+        замінює попередній, як і при послідовних викликах add_product.
+        Залишки всіх рядків перевіряються одним викликом рушія складу.
+        """
+        report = []
+        requested = {}
+        for product, amount in lines:
+            if not isinstance(amount, int) or amount <= 0:
+                report.append(CartLineResult(product, amount, False, "Amount must be a positive integer"))
+            else:
+                requested[product] = max(amount, requested.get(product, 0))
+                report.append(CartLineResult(product, amount, True))
+
+        # для товарів, яких не вистачає, відомий залишок — з ним і порівнюється кожен рядок
+        short = inventory.check_available(requested)
+        accepted = {}
+        for line in report:
+            if not line.added:
+                continue
+            if line.product in short and line.amount > short[line.product]:
+                line.added = False
+                line.error = f"Product {line.product} has only {short[line.product]} items"
+            else:
+                accepted[line.product] = line.amount
+
+        for product, amount in accepted.items():
+            self._set_line(product, amount)
+        return report
 
     def remove_product(self, product):
         """Видалити товар з кошика."""
+        self._remove_line(product)
+
+    def remove_products(self, products: Iterable[Product]):
+        """Видалити кілька товарів; повертає кількість реально видалених рядків."""
+        removed = 0
+        for product in products:
+            if product in self.products:
+                self._remove_line(product)
+                removed += 1
+        return removed
+
+    def update_price(self, product):
+        """Перерахувати суму після зміни ціни товару, що вже лежить у кошику."""
+        if product not in self.products:
+            return
+        unit_price = Decimal(str(product.price))
+        self._total += (unit_price - self._unit_prices[product]) * self.products[product]
+        self._unit_prices[product] = unit_price
+
+    def refresh_prices(self):
+        """Підтягнути актуальні ціни всіх товарів кошика."""
+        # позначки знімаються до читання цін, тож зміна під час проходу перерахується наступного разу
+        with _carts_lock:
+            self._stale = set()
+        for product in list(self.products):
+            self.update_price(product)
+
+    def clear(self):
+        """Очистити кошик."""
+        with _carts_lock:
+            for product in self.products:
+                self._unwatch(product)
+            self._stale = set()
+        self.products.clear()
+        self._unit_prices.clear()
+        self._total = Decimal(0)
+
+    def _set_line(self, product, amount):
+        self._remove_line(product)
+        # спершу підписка, потім ціна: зміна між ними лише позначить рядок ще раз
+        with _carts_lock:
+            _carts_by_name.setdefault(product.name, weakref.WeakKeyDictionary())[self] = product
+        unit_price = Decimal(str(product.price))
+        self.products[product] = amount
+        self._unit_prices[product] = unit_price
+        self._total += unit_price * amount
+
+    def _remove_line(self, product):
         if product in self.products:
-            del self.products[product]
+            with _carts_lock:
+                self._unwatch(product)
+                self._stale.discard(product)
+            self._total -= self._unit_prices.pop(product) * self.products.pop(product)
+
+    def _unwatch(self, product):
+        # викликається під _carts_lock
+        carts = _carts_by_name.get(product.name)
+        if carts is not None:
+            carts.pop(self, None)
+            if not carts:
+                del _carts_by_name[product.name]
+
+    def reserve_cart_order(self, ttl: float = None):
+        """Зарезервувати всі товари кошика одразу або жодного."""
+        return inventory.reserve(self.products, ttl)
 
     def submit_cart_order(self):
         """Оформити замовлення — списати товари та повернути їх ID."""
-        product_ids = []
-        for product, count in self.products.items():
-            product.buy(count)
-            product_ids.append(str(product))
-        self.products.clear()
+        reservation = self.reserve_cart_order()
+        inventory.commit(reservation)
+        product_ids = [str(product) for product in reservation.items]
+        self.clear()
         return product_ids
 
 
@@ -91,7 +250,7 @@ class Order:
 
     cart: ShoppingCart
     shipping_service: ShippingService
-    order_id: str = str(uuid.uuid4())
+    order_id: str = field(default_factory=new_order_id)
 
     def place_order(self, shipping_type, due_date: datetime = None):
         """Оформити замовлення з вказаним типом доставки та дедлайном."""
@@ -104,11 +263,26 @@ class Order:
         if due_date <= datetime.now(timezone.utc):
             raise ValueError("Shipping due datetime must be greater than datetime now")
 
-        product_ids = self.cart.submit_cart_order()
-
-        return self.shipping_service.create_shipping(
-            shipping_type, product_ids, self.order_id, due_date
-        )
+        reservation = self.cart.reserve_cart_order()
+        product_ids = [str(product) for product in reservation.items]
+        try:
+            shipping_id = self.shipping_service.create_shipping(
+                shipping_type, product_ids, self.order_id, due_date
+            )
+        except Exception:
+            # доставку не створено — повертаємо товари на склад
+            inventory.release(reservation)
+            raise
+
+        try:
+            # резерв міг прострочитися під час створення доставки — тоді commit списує товари знову
+            inventory.commit(reservation)
+        except ValueError:
+            # товари вже розкупили: доставку не можна виконати, тож не лишаємо її активною
+            self.shipping_service.fail_shipping(shipping_id)
+            raise
+        self.cart.clear()
+        return shipping_id
 
 
 @dataclass
@@ -121,3 +295,16 @@ class Shipment:
     def check_shipping_status(self):
         """Отримати статус поточної доставки."""
         return self.shipping_service.check_status(self.shipping_id)
+
+    @staticmethod
+    def check_shipping_statuses(shipments):
+        """Отримати статуси кількох доставок пакетними запитами замість запиту на кожну."""
+        by_service = {}
+        for shipment in shipments:
+            service_shipments = by_service.setdefault(id(shipment.shipping_service), (shipment.shipping_service, []))
+            service_shipments[1].append(shipment.shipping_id)
+
+        statuses = {}
+        for service, shipping_ids in by_service.values():
+            statuses.update(service.check_statuses(shipping_ids))
+        return statuses
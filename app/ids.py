@@ -0,0 +1,96 @@
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+CROCKFORD_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_DECODE = {char: value for value, char in enumerate(CROCKFORD_ALPHABET)}
+# пари символів для 10-бітних шматків — кодування за 8 звертань до таблиці
+_PAIRS = [first + second for first in CROCKFORD_ALPHABET for second in CROCKFORD_ALPHABET]
+_RANDOM_SHIFTS = tuple(range(70, -1, -10))
+_RANDOM_BITS = 80
+
+
+class UlidGenerator:
+    """Генератор ULID — 26 символів, що сортуються за часом створення.
+
+    48 біт — мітка часу в мілісекундах, 80 біт — випадкова частина. Генератор
+    ініціалізується з ``os.urandom`` один раз, а в межах однієї мілісекунди
+    лише збільшує випадкову частину, тож ID унікальні й монотонні без
+    системного виклику на кожен ID. Після ``fork`` заново ініціалізується
+    лише поточний генератор ID замовлень.
+    """
+
+    def __init__(self, clock=time.time_ns, seed=None):
+        """Створити генератор; ``clock`` повертає час у наносекундах."""
+        self.clock = clock
+        self._seed = seed
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+        self._prefix = ''
+        self._reseed()
+
+    def _reseed(self):
+        # після fork лок міг лишитися захопленим потоком, якого в дочірньому процесі немає
+        self._lock = threading.Lock()
+        seed = self._seed if self._seed is not None else int.from_bytes(os.urandom(16), 'big')
+        self._rng = random.Random(seed)
+        self._last_ms = -1
+
+    def __call__(self):
+        """Згенерувати новий ULID."""
+        with self._lock:
+            now_ms = self.clock() // 1_000_000
+            if now_ms > self._last_ms:
+                self._set_ms(now_ms)
+                self._last_random = self._rng.getrandbits(_RANDOM_BITS)
+            else:
+                self._last_random += 1
+                if self._last_random >> _RANDOM_BITS:
+                    # випадкова частина вичерпана — позичаємо наступну мілісекунду
+                    self._set_ms(self._last_ms + 1)
+                    self._last_random = self._rng.getrandbits(_RANDOM_BITS - 1)
+            prefix, random_part = self._prefix, self._last_random
+
+        return prefix + ''.join([_PAIRS[(random_part >> shift) & 1023] for shift in _RANDOM_SHIFTS])
+
+    def _set_ms(self, now_ms):
+        # префікс з часу кодується лише раз на мілісекунду
+        self._last_ms = now_ms
+        self._prefix = ''.join([_PAIRS[(now_ms >> shift) & 1023] for shift in (40, 30, 20, 10, 0)])
+
+
+def ulid_datetime(ulid: str):
+    """Отримати час створення з ULID."""
+    value = 0
+    for char in ulid[:10]:
+        value = (value << 5) | _DECODE[char]
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+_order_id_generator = UlidGenerator()
+
+
+def set_order_id_generator(generator):
+    """Замінити генератор ID замовлень (будь-який callable, що повертає str)."""
+    global _order_id_generator  # pylint: disable=global-statement
+    _order_id_generator = generator
+
+
+def new_order_id():
+    """Згенерувати ID нового замовлення поточним генератором."""
+    return _order_id_generator()
+
+
+def _reseed_after_fork():
+    # дочірній процес інакше продовжив би ту саму послідовність, що й батьківський
+    reseed = getattr(_order_id_generator, '_reseed', None)
+    if reseed is not None:
+        reseed()
+
+
+if hasattr(os, 'register_at_fork'):
+    # один хук на модуль: генератори не реєструються самі, тож не живуть вічно через нього
+    os.register_at_fork(after_in_child=_reseed_after_fork)
@@ -0,0 +1,184 @@
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict
+
+
+@dataclass
+class Reservation:
+    """Тимчасове утримання товарів до підтвердження або скасування."""
+
+    reservation_id: int
+    items: Dict[object, int]
+    expires_at: float
+    state: str = 'held'
+
+
+class InventoryEngine:
+    """Потокобезпечне списання та резервування залишків товарів.
+
+    Кожен товар захищений одним із ``stripes`` локів (за хешем назви), тож
+    покупки різних товарів не блокують одна одну. Резервування кількох
+    товарів бере локи у порядку зростання номера — так дві паралельні
+    покупки не можуть зайти у взаємне блокування.
+    """
+
+    def __init__(self, stripes: int = 64, hold_ttl: float = 300, clock=time.monotonic):
+        """Створити рушій з ``stripes`` локами та часом життя резерву ``hold_ttl`` секунд."""
+        if stripes < 1:
+            raise ValueError("Inventory needs at least one lock stripe")
+        self.hold_ttl = hold_ttl
+        self.clock = clock
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._holds: Dict[int, Reservation] = {}
+        self._expiry = []
+        self._holds_lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def _locks_for(self, products):
+        stripes = sorted({hash(product.name) % len(self._locks) for product in products})
+        return [self._locks[stripe] for stripe in stripes]
+
+    def _acquire(self, products):
+        locks = self._locks_for(products)
+        for lock in locks:
+            lock.acquire()
+        return locks
+
+    @staticmethod
+    def _release_locks(locks):
+        for lock in reversed(locks):
+            lock.release()
+
+    def buy(self, product, amount: int):
+        """Атомарно перевірити залишок і списати ``amount`` одиниць товару."""
+        locks = self._acquire([product])
+        try:
+            if product.available_amount < amount:
+                raise ValueError(f"Product {product} has only {product.available_amount} items")
+            product.available_amount -= amount
+        finally:
+            self._release_locks(locks)
+
+    def restock(self, product, amount: int):
+        """Повернути або додати ``amount`` одиниць товару на склад."""
+        locks = self._acquire([product])
+        try:
+            product.available_amount += amount
+        finally:
+            self._release_locks(locks)
+
+    def check_available(self, items: Dict[object, int]):
+        """Перевірити залишки кількох товарів одним проходом під їхніми локами.
+
+        Повертає ``{товар: наявна кількість}`` лише для товарів, яких менше,
+        ніж запитано; порожній словник — усе є.
+        """
+        items = dict(items)
+        locks = self._acquire(items)
+        try:
+            return {
+                product: product.available_amount
+                for product, amount in items.items()
+                if product.available_amount < amount
+            }
+        finally:
+            self._release_locks(locks)
+
+    def reserve(self, items: Dict[object, int], ttl: float = None):
+        """Зарезервувати всі товари або жодного; повертає Reservation."""
+        self.expire_holds()
+        items = dict(items)
+        locks = self._acquire(items)
+        try:
+            for product, amount in items.items():
+                if product.available_amount < amount:
+                    raise ValueError(f"Product {product} has only {product.available_amount} items")
+            for product, amount in items.items():
+                product.available_amount -= amount
+        finally:
+            self._release_locks(locks)
+
+        reservation = Reservation(next(self._ids), items, self.clock() + (self.hold_ttl if ttl is None else ttl))
+        with self._holds_lock:
+            self._holds[reservation.reservation_id] = reservation
+            heapq.heappush(self._expiry, (reservation.expires_at, reservation.reservation_id))
+        return reservation
+
+    def commit(self, reservation: Reservation):
+        """Підтвердити резерв — товари залишаються списаними.
+
+        Якщо резерв устиг прострочитися і товари вже повернуто на склад, вони
+        списуються знову під тими самими локами; ValueError — лише коли їх
+        тим часом розкупили або резерв уже завершено.
+        """
+        with self._holds_lock:
+            held = self._holds.pop(reservation.reservation_id, None) is not None
+            state, reservation.state = reservation.state, 'committed'
+        if held:
+            return
+        if state != 'expired':
+            reservation.state = state
+            raise ValueError("Reservation was already finished")
+
+        locks = self._acquire(reservation.items)
+        try:
+            for product, amount in reservation.items.items():
+                if product.available_amount < amount:
+                    reservation.state = state
+                    raise ValueError(f"Reservation has expired and {product} has only "
+                                     f"{product.available_amount} items")
+            for product, amount in reservation.items.items():
+                product.available_amount -= amount
+        finally:
+            self._release_locks(locks)
+
+    def release(self, reservation: Reservation):
+        """Скасувати резерв і повернути товари на склад."""
+        with self._holds_lock:
+            if self._holds.pop(reservation.reservation_id, None) is None:
+                return False
+            reservation.state = 'released'
+        self._return_items(reservation.items)
+        return True
+
+    def expire_holds(self):
+        """Повернути на склад усі прострочені резерви."""
+        now = self.clock()
+        due = []
+        with self._holds_lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                _, reservation_id = heapq.heappop(self._expiry)
+                reservation = self._holds.get(reservation_id)
+                if reservation is not None:
+                    due.append(reservation)
+
+        expired = 0
+        for reservation in due:
+            # стан 'expired' з'являється лише під локами товарів, тож commit, який його побачить,
+            # візьме ці локи вже після повернення товарів на склад
+            locks = self._acquire(reservation.items)
+            try:
+                with self._holds_lock:
+                    if self._holds.pop(reservation.reservation_id, None) is None:
+                        continue
+                    reservation.state = 'expired'
+                for product, amount in reservation.items.items():
+                    product.available_amount += amount
+                expired += 1
+            finally:
+                self._release_locks(locks)
+        return expired
+
+    def _return_items(self, items):
+        locks = self._acquire(items)
+        try:
+            for product, amount in items.items():
+                product.available_amount += amount
+        finally:
+            self._release_locks(locks)
+
+
+inventory = InventoryEngine()
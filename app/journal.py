@@ -0,0 +1,181 @@
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from array import array
+
+JOURNAL_FILE = 'inventory.journal'
+SNAPSHOT_FILE = 'inventory.snapshot'
+
+
+class InventoryJournal:
+    """Журнал залишків каталогу у файлі, відображеному в пам'ять (mmap).
+
+    Кожна зміна залишку дописується записом фіксованого розміру
+    ``(seq, індекс товару, зміна, новий залишок, crc32)``, тож запис — це
+    кілька байтів у вже відображену сторінку без системних викликів.
+    ``snapshot`` зберігає колонку ``amounts`` каталогу цілком і починає журнал
+    з нуля, а ``recover`` при старті читає знімок і доганяє його хвостом
+    журналу. Записи містять абсолютний залишок, тому повтор запису, який уже
+    потрапив у знімок, нічого не ламає.
+
+    Товари ідентифікуються індексом у каталозі: перед ``recover`` каталог має
+    бути завантажений з тими самими товарами в тому самому порядку.
+    """
+
+    MAGIC = b'INVJRNL1'
+    SNAPSHOT_MAGIC = b'INVSNAP1'
+    # magic, базовий seq — записи журналу йдуть від base + 1 без пропусків
+    HEADER = struct.Struct('<8sQ16x')
+    RECORD = struct.Struct('<QIqqI')
+    BODY = struct.Struct('<QIqq')
+    CRC = struct.Struct('<I')
+    # magic, seq останнього запису у знімку, кількість товарів
+    SNAPSHOT_HEADER = struct.Struct('<8sQQ8x')
+
+    def __init__(self, catalog, directory, chunk_records: int = 65536, snapshot_every: int = None):
+        """Відкрити або створити журнал каталогу ``catalog`` у теці ``directory``.
+
+        Файл журналу росте шматками по ``chunk_records`` записів. Якщо задано
+        ``snapshot_every``, знімок робиться автоматично після стількох записів.
+        """
+        if chunk_records < 1:
+            raise ValueError("Journal chunk must hold at least one record")
+        self.catalog = catalog
+        self.directory = directory
+        self.chunk_records = chunk_records
+        self.snapshot_every = snapshot_every
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(self.journal_path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size < self.HEADER.size:
+            self._file.truncate(self.HEADER.size + self.chunk_records * self.RECORD.size)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+            self.HEADER.pack_into(self._map, 0, self.MAGIC, 0)
+        else:
+            self._map = mmap.mmap(self._file.fileno(), 0)
+            if self._map[:len(self.MAGIC)] != self.MAGIC:
+                self.close()
+                raise ValueError(f"{self.journal_path} is not an inventory journal")
+        self._base = self.HEADER.unpack_from(self._map)[1]
+        self._seq, self._end = self._base, self.HEADER.size
+        for seq, _, _, _ in self._records():
+            self._seq, self._end = seq, self._end + self.RECORD.size
+
+    def __len__(self):
+        """Кількість записів після останнього знімка."""
+        return self._seq - self._base
+
+    def _records(self):
+        # читання зупиняється на першому недописаному, пошкодженому або старому записі
+        offset = self.HEADER.size
+        expected = self._base + 1
+        while offset + self.RECORD.size <= len(self._map):
+            seq, index, delta, amount, crc = self.RECORD.unpack_from(self._map, offset)
+            if seq != expected or zlib.crc32(self._map[offset:offset + self.BODY.size]) != crc:
+                return
+            yield seq, index, delta, amount
+            offset += self.RECORD.size
+            expected += 1
+
+    def append(self, index: int, delta: int, amount: int):
+        """Дописати зміну залишку товару з індексом ``index``."""
+        with self._lock:
+            if self._end + self.RECORD.size > len(self._map):
+                self._grow()
+            self._seq += 1
+            body = self.BODY.pack(self._seq, index, delta, amount)
+            self._map[self._end:self._end + self.BODY.size] = body
+            self.CRC.pack_into(self._map, self._end + self.BODY.size, zlib.crc32(body))
+            self._end += self.RECORD.size
+            if self.snapshot_every and self._seq - self._base >= self.snapshot_every:
+                self._snapshot()
+
+    def _grow(self):
+        size = len(self._map) + self.chunk_records * self.RECORD.size
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def snapshot(self):
+        """Записати знімок усіх залишків каталогу й почати журнал спочатку."""
+        with self._lock:
+            self._snapshot()
+
+    def _snapshot(self):
+        amounts = array('q', self.catalog.amounts)
+        if sys.byteorder != 'little':
+            amounts.byteswap()
+        # спершу знімок атомарно замінює попередній, і лише потім журнал забуває записи —
+        # після збою між цими кроками записи до seq знімка просто пропускаються
+        part_path = self.snapshot_path + '.part'
+        with open(part_path, 'wb') as snapshot:
+            snapshot.write(self.SNAPSHOT_HEADER.pack(self.SNAPSHOT_MAGIC, self._seq, len(amounts)))
+            snapshot.write(amounts.tobytes())
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(part_path, self.snapshot_path)
+
+        # старі записи лишаються у файлі, але їх seq не продовжує новий base, тож вони не читаються
+        self._base, self._end = self._seq, self.HEADER.size
+        self.HEADER.pack_into(self._map, 0, self.MAGIC, self._base)
+        self._map.flush()
+
+    def recover(self):
+        """Відновити залишки каталогу зі знімка та хвоста журналу і підключити журнал до каталогу.
+
+        Повертає кількість застосованих записів журналу.
+        """
+        amounts = self.catalog.amounts
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as snapshot, \
+                    mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic, snapshot_seq, count = self.SNAPSHOT_HEADER.unpack_from(data)
+                if magic != self.SNAPSHOT_MAGIC:
+                    raise ValueError(f"{self.snapshot_path} is not an inventory snapshot")
+                if count > len(amounts):
+                    raise ValueError(f"Snapshot has {count} products, catalog only {len(amounts)}")
+                stored = array('q')
+                stored.frombytes(data[self.SNAPSHOT_HEADER.size:self.SNAPSHOT_HEADER.size + count * stored.itemsize])
+                if sys.byteorder != 'little':
+                    stored.byteswap()
+                amounts[:count] = stored
+
+        replayed = 0
+        for seq, index, _, amount in self._records():
+            if seq <= snapshot_seq:
+                continue
+            if index >= len(amounts):
+                raise ValueError(f"Journal refers to product #{index}, catalog has {len(amounts)}")
+            amounts[index] = amount
+            replayed += 1
+
+        self.catalog.journal = self
+        return replayed
+
+    def flush(self):
+        """Скинути записані сторінки журналу на диск (msync)."""
+        with self._lock:
+            self._map.flush()
+
+    def close(self):
+        """Закрити журнал і відключити його від каталогу."""
+        if getattr(self.catalog, 'journal', None) is self:
+            self.catalog.journal = None
+        if not self._map.closed:
+            self._map.flush()
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
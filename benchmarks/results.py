@@ -0,0 +1,40 @@
+"""Recording benchmark runs in ``.benchmarks/*.jsonl`` and comparing them between commits."""
+
+import json
+import os
+import subprocess
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.benchmarks')
+
+
+def results_path(name):
+    return os.path.join(RESULTS_DIR, f'{name}.jsonl')
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def previous_run(path, run, keys):
+    # the latest run of a different commit made with the same settings
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path, encoding='utf-8') as results:
+        for line in results:
+            recorded = json.loads(line)
+            comparable = all(recorded.get(key) == run[key] for key in keys)
+            if comparable and recorded['commit'] != run['commit']:
+                previous = recorded
+    return previous
+
+
+def save(path, run):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as results:
+        results.write(json.dumps(run) + '\n')
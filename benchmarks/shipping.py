@@ -0,0 +1,131 @@
+"""Throughput benchmarks for the shipping pipeline on in-memory fakes.
+
+Run with ``python -m benchmarks.shipping``. Every run is appended to
+``.benchmarks/shipping.jsonl`` together with the current git commit, and the
+numbers are compared with the latest run recorded for a different commit.
+"""
+
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.eshop import Order, Product, ShoppingCart
+from benchmarks.results import git_commit, previous_run, results_path, save
+from services import ShippingService
+from services.testing import FakeShippingPublisher, FakeShippingRepository
+
+RESULTS_PATH = results_path('shipping')
+
+
+def _percentile(samples, percent):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def _summary(count, elapsed, latencies):
+    return {
+        'ops_per_sec': round(count / elapsed, 1),
+        'p50_ms': round(_percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(_percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+    }
+
+
+def _service(latency):
+    return ShippingService(FakeShippingRepository(latency), FakeShippingPublisher(latency))
+
+
+def bench_place_order(orders, latency):
+    service = _service(latency)
+    shipping_type = service.list_available_shipping_type()[0]
+    due_date = datetime.now(timezone.utc) + timedelta(hours=1)
+    product = Product(name='Product', price=10.0, available_amount=orders)
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(orders):
+        cart = ShoppingCart()
+        cart.add_product(product, 1)
+        call_started = time.perf_counter()
+        Order(cart, service).place_order(shipping_type, due_date)
+        latencies.append(time.perf_counter() - call_started)
+    return _summary(orders, time.perf_counter() - started, latencies)
+
+
+def bench_create_shippings(orders, latency, batch_size=100):
+    service = _service(latency)
+    shipping_type = service.list_available_shipping_type()[0]
+    due_date = datetime.now(timezone.utc) + timedelta(hours=1)
+
+    latencies = []
+    started = time.perf_counter()
+    for start in range(0, orders, batch_size):
+        batch = [
+            {'shipping_type': shipping_type, 'product_ids': ['Product'], 'order_id': str(number), 'due_date': due_date}
+            for number in range(start, min(orders, start + batch_size))
+        ]
+        call_started = time.perf_counter()
+        service.create_shippings(batch)
+        latencies.append((time.perf_counter() - call_started) / len(batch))
+    return _summary(orders, time.perf_counter() - started, latencies)
+
+
+def bench_process_shipping_batch(messages, latency):
+    service = _service(latency)
+    due_date = datetime.now(timezone.utc) + timedelta(hours=1)
+    service.create_shippings([
+        {'shipping_type': service.list_available_shipping_type()[0], 'product_ids': ['Product'],
+         'order_id': str(number), 'due_date': due_date}
+        for number in range(messages)
+    ])
+
+    latencies = []
+    processed = 0
+    started = time.perf_counter()
+    while processed < messages:
+        call_started = time.perf_counter()
+        batch = service.process_shipping_batch()
+        if not batch:
+            break
+        latencies.append((time.perf_counter() - call_started) / len(batch))
+        processed += len(batch)
+    return _summary(processed, time.perf_counter() - started, latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='injected latency per AWS call')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args(argv)
+
+    latency = args.latency_ms / 1000
+    run = {
+        'commit': git_commit(),
+        'date': datetime.now(timezone.utc).isoformat(),
+        'orders': args.orders,
+        'latency_ms': args.latency_ms,
+        'results': {
+            'place_order': bench_place_order(args.orders, latency),
+            'create_shippings': bench_create_shippings(args.orders, latency),
+            'process_shipping_batch': bench_process_shipping_batch(args.orders, latency),
+        },
+    }
+
+    previous = previous_run(RESULTS_PATH, run, ('orders', 'latency_ms'))
+    for name, result in run['results'].items():
+        line = f"{name:<24} {result['ops_per_sec']:>10.1f} ops/s  p50 {result['p50_ms']:.3f} ms  " \
+               f"p99 {result['p99_ms']:.3f} ms"
+        if previous and name in previous['results']:
+            before = previous['results'][name]['ops_per_sec']
+            line += f"  ({(result['ops_per_sec'] - before) / before:+.1%} vs {previous['commit']})"
+        print(line)
+
+    if not args.no_save:
+        save(RESULTS_PATH, run)
+    return run
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Import time and memory of a cold ``import app.eshop``.
+
+Run with ``python -m benchmarks.startup``. Every sample is a fresh
+interpreter, so nothing is cached in ``sys.modules``. Runs are appended to
+``.benchmarks/startup.jsonl`` and compared with the latest run recorded for
+a different commit.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+from benchmarks.results import git_commit, previous_run, results_path, save
+
+RESULTS_PATH = results_path('startup')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ru_maxrss is the peak RSS, in KiB on Linux and in bytes on macOS
+_SAMPLE = """
+import json, resource, sys, time
+scale = 1 if sys.platform == 'darwin' else 1024
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+print(json.dumps({{
+    'import_ms': elapsed * 1000,
+    'rss_mb': after / 2 ** 20,
+    'rss_delta_mb': (after - before) / 2 ** 20,
+    'modules': len(sys.modules),
+    'boto3_loaded': 'boto3' in sys.modules,
+}}))
+"""
+
+
+def sample(module):
+    output = subprocess.run(
+        [sys.executable, '-c', _SAMPLE.format(module=module)], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output)
+
+
+def bench_import(module, repeat):
+    samples = [sample(module) for _ in range(repeat)]
+    return {
+        'import_ms': round(statistics.median(s['import_ms'] for s in samples), 1),
+        'rss_mb': round(statistics.median(s['rss_mb'] for s in samples), 1),
+        'rss_delta_mb': round(statistics.median(s['rss_delta_mb'] for s in samples), 1),
+        'modules': samples[-1]['modules'],
+        'boto3_loaded': samples[-1]['boto3_loaded'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', action='append', help='module to import, can be repeated (default app.eshop)')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args(argv)
+
+    modules = args.module or ['app.eshop']
+    run = {
+        'commit': git_commit(),
+        'date': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'repeat': args.repeat,
+        'results': {module: bench_import(module, args.repeat) for module in modules},
+    }
+
+    previous = previous_run(RESULTS_PATH, run, ('python',))
+    for module, result in run['results'].items():
+        line = f"{module:<24} {result['import_ms']:>8.1f} ms  rss {result['rss_mb']:.1f} MB " \
+               f"(+{result['rss_delta_mb']:.1f})  {result['modules']} modules  boto3 {result['boto3_loaded']}"
+        if previous and module in previous['results']:
+            before = previous['results'][module]
+            line += f"  (was {before['import_ms']:.1f} ms, +{before['rss_delta_mb']:.1f} MB at {previous['commit']})"
+        print(line)
+
+    if not args.no_save:
+        save(RESULTS_PATH, run)
+    return run
+
+
+if __name__ == '__main__':
+    main()
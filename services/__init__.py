@@ -1 +1,37 @@
-from .service import ShippingService
\ No newline at end of file
+"""Shipping services.
+
+Names are imported on first access, so ``import services`` (and app.eshop,
+which only needs ShippingService for type hints) does not load boto3.
+"""
+
+import importlib
+
+_EXPORTS = {
+    'ShippingService': '.service',
+    'ShippingRepository': '.repository',
+    'ShippingPublisher': '.publisher',
+    'ShippingMessage': '.publisher',
+    'ShippingConsumer': '.consumer',
+    'OutboxRelay': '.outbox',
+    'OverdueShippingSweeper': '.sweeper',
+    'CachingShippingRepository': '.cache',
+    'AsyncShippingService': '.async_service',
+    'CarrierAdapter': '.carriers',
+    'CarrierRegistry': '.carriers',
+    'CarrierDispatcher': '.carriers',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
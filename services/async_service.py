@@ -0,0 +1,113 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import AWS_MAX_POOL_CONNECTIONS
+from .publisher import group_messages
+from .service import ShippingService
+
+
+class AsyncBridge:
+    """Exposes the methods of a blocking object as coroutines run on a bounded executor."""
+
+    def __init__(self, target, executor):
+        self.target = target
+        self.executor = executor
+
+    def __getattr__(self, name):
+        attribute = getattr(self.target, name)
+        if not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(attribute, *args, **kwargs))
+
+        return call
+
+
+class AsyncShippingRepository(AsyncBridge):
+    pass
+
+
+class AsyncShippingPublisher(AsyncBridge):
+    pass
+
+
+class AsyncShippingService:
+    """asyncio counterpart of ShippingService.
+
+    boto3 calls stay blocking, so they run on a thread pool of ``max_workers``
+    threads (by default as many as the pooled AWS connections). The event loop
+    is never blocked and up to ``max_workers`` calls are on the wire at once;
+    the rest wait in the executor queue. An ``executor`` passed in stays
+    the caller's: ``close`` only shuts down the pool the service created.
+    """
+
+    def __init__(self, repository, publisher, max_workers: int = AWS_MAX_POOL_CONNECTIONS, executor=None):
+        self._owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shipping-async')
+        self.service = ShippingService(repository, publisher)
+        self.repository = AsyncShippingRepository(repository, self.executor)
+        self.publisher = AsyncShippingPublisher(publisher, self.executor)
+        self._bridge = AsyncBridge(self.service, self.executor)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._owns_executor:
+            self.executor.shutdown(wait=True)
+
+    @staticmethod
+    def list_available_shipping_type():
+        return ShippingService.list_available_shipping_type()
+
+    async def create_shipping(self, shipping_type, product_ids, order_id, due_date):
+        return await self._bridge.create_shipping(shipping_type, product_ids, order_id, due_date)
+
+    async def create_shippings(self, batch):
+        return await self._bridge.create_shippings(list(batch))
+
+    async def check_status(self, shipping_id):
+        return await self._bridge.check_status(shipping_id)
+
+    async def check_statuses(self, shipping_ids):
+        return await self._bridge.check_statuses(list(shipping_ids))
+
+    async def process_shipping(self, shipping_id):
+        return await self._bridge.process_shipping(shipping_id)
+
+    async def process_shipping_batch(self):
+        # unlike the blocking version, messages of one batch are processed concurrently,
+        # except that the messages of one FIFO group still go one after another
+        messages = await self.publisher.poll_shipping()
+        if not messages:
+            return []
+
+        await self._bridge.extend_expiring(messages)
+        outcomes = {}
+        await asyncio.gather(*(self._process_group(group, outcomes) for group in group_messages(messages)))
+
+        processed = [message for message in messages
+                     if id(message) in outcomes and not isinstance(outcomes[id(message)], Exception)]
+        if processed:
+            await self.publisher.acknowledge(processed)
+
+        for message in messages:
+            if isinstance(outcomes.get(id(message)), Exception):
+                raise outcomes[id(message)]
+        return [outcomes[id(message)] for message in messages]
+
+    async def _process_group(self, messages, outcomes):
+        for message in messages:
+            try:
+                outcomes[id(message)] = await self.process_shipping(message.shipping_id)
+            except Exception as error:  # pylint: disable=broad-except
+                # the rest of the group is left unacknowledged and redelivered after this one
+                outcomes[id(message)] = error
+                return
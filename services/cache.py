@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import OrderedDict
+
+from .service import ShippingService
+
+_MISSING = object()
+# cached in place of an item the table does not have
+_NOT_FOUND = object()
+
+
+class TTLCache:
+    """Size-bounded LRU cache with a TTL per entry, safe to share between threads."""
+
+    def __init__(self, max_size: int = 10000, clock=time.monotonic):
+        if max_size < 1:
+            raise ValueError("Cache size must be a positive integer")
+        self.max_size = max_size
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        # like get, but does not count towards the stats or refresh recency
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING or entry[1] <= self.clock():
+                return default
+            return entry[0]
+
+    def set(self, key, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, self.clock() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'size': len(self._entries),
+        }
+
+
+class CachingShippingRepository:
+    """Read-through cache around ShippingRepository.get_shipping.
+
+    Writes made through this object update or drop the cached item, so a
+    process always sees its own changes. Writes made by other processes are
+    seen once the entry expires, which is why "in progress" items get a short
+    TTL and terminal ones a long one. Ids the table does not have are
+    remembered for ``miss_ttl`` seconds, so polling an unknown id does not
+    reach DynamoDB every time. Other repository methods are delegated
+    unchanged.
+    """
+
+    TERMINAL_STATUSES = (ShippingService.SHIPPING_COMPLETED, ShippingService.SHIPPING_FAILED)
+
+    def __init__(self, repository, max_size: int = 10000, ttl: float = 5, terminal_ttl: float = 300,
+                 miss_ttl: float = 1, clock=time.monotonic):
+        self.repository = repository
+        self.ttl = ttl
+        self.terminal_ttl = terminal_ttl
+        self.miss_ttl = miss_ttl
+        self.cache = TTLCache(max_size, clock)
+
+    def __getattr__(self, name):
+        return getattr(self.repository, name)
+
+    def stats(self):
+        return self.cache.stats()
+
+    def get_shipping(self, shipping_id):
+        item = self.cache.get(shipping_id)
+        if item is _NOT_FOUND:
+            return None
+        if item is None:
+            item = self.repository.get_shipping(shipping_id)
+            if item is None:
+                self.cache.set(shipping_id, _NOT_FOUND, self.miss_ttl)
+                return None
+            self._store(item)
+        return dict(item)
+
+    def get_shipping_statuses(self, shipping_ids):
+        statuses = {}
+        misses = []
+        for shipping_id in shipping_ids:
+            item = self.cache.get(shipping_id)
+            if item is None:
+                misses.append(shipping_id)
+            elif item is not _NOT_FOUND:
+                statuses[shipping_id] = item['shipping_status']
+
+        if misses:
+            found = self.repository.get_shipping_statuses(misses)
+            statuses.update(found)
+            for shipping_id in misses:
+                if shipping_id not in found:
+                    self.cache.set(shipping_id, _NOT_FOUND, self.miss_ttl)
+        return statuses
+
+    def create_shipping(self, shipping_type, product_ids, order_id, status, due_date):
+        shipping_id = self.repository.create_shipping(shipping_type, product_ids, order_id, status, due_date)
+        self.cache.invalidate(shipping_id)
+        return shipping_id
+
+    def create_shippings(self, shippings, status):
+        shipping_ids = self.repository.create_shippings(shippings, status)
+        for shipping_id in shipping_ids:
+            self.cache.invalidate(shipping_id)
+        return shipping_ids
+
+    def create_shipping_with_outbox(self, shipping_type, product_ids, order_id, status, due_date):
+        shipping_id = self.repository.create_shipping_with_outbox(shipping_type, product_ids, order_id, status,
+                                                                  due_date)
+        self.cache.invalidate(shipping_id)
+        return shipping_id
+
+    def rewrite_legacy(self, item):
+        rewritten = self.repository.rewrite_legacy(item)
+        self.cache.invalidate(item['shipping_id'])
+        return rewritten
+
+    def update_shipping_status(self, shipping_id, status):
+        response = self.repository.update_shipping_status(shipping_id, status)
+        self._set_status(shipping_id, status)
+        return response
+
+    def transition_status(self, shipping_id, from_statuses, on_time_status, overdue_status, now=None):
+        status = self.repository.transition_status(shipping_id, from_statuses, on_time_status, overdue_status, now)
+        if status is None:
+            # someone else already moved it, so what we hold is stale
+            self.cache.invalidate(shipping_id)
+        else:
+            self._set_status(shipping_id, status)
+        return status
+
+    def fail_overdue(self, shipping_id, from_statuses, overdue_status, now=None):
+        failed = self.repository.fail_overdue(shipping_id, from_statuses, overdue_status, now)
+        if failed:
+            self._set_status(shipping_id, overdue_status)
+        else:
+            # not overdue after all, or moved by someone else; either way we may be stale
+            self.cache.invalidate(shipping_id)
+        return failed
+
+    def _set_status(self, shipping_id, status):
+        item = self.cache.peek(shipping_id)
+        if item is None or item is _NOT_FOUND:
+            self.cache.invalidate(shipping_id)
+        else:
+            self._store({**item, 'shipping_status': status})
+
+    def _store(self, item):
+        ttl = self.terminal_ttl if item.get('shipping_status') in self.TERMINAL_STATUSES else self.ttl
+        self.cache.set(item['shipping_id'], item, ttl)
@@ -0,0 +1,214 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .service import ShippingService
+
+logger = logging.getLogger(__name__)
+
+
+class CarrierAdapter:
+    """Hands batches of one carrier's shipments over for creation.
+
+    The default adapter writes and publishes them with
+    ``ShippingService.create_shippings``; a carrier with its own API
+    overrides ``send`` and returns one result dict per shipment in the same
+    order. ``max_batch`` and ``max_delay`` bound how long shipments wait for
+    their batch, ``concurrency`` how many batches of this carrier are in
+    flight at once.
+    """
+
+    def __init__(self, shipping_type: str, service, max_batch: int = ShippingService.CREATE_BATCH_SIZE,
+                 max_delay: float = 0.5, concurrency: int = 2):
+        if max_batch < 1 or concurrency < 1:
+            raise ValueError("Carrier needs a positive batch size and concurrency")
+        self.shipping_type = shipping_type
+        self.service = service
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.concurrency = concurrency
+
+    def send(self, batch: list):
+        return self.service.create_shippings(batch)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.shipping_type!r})"
+
+
+class CarrierRegistry:
+    """Carrier adapters by shipping type."""
+
+    def __init__(self, adapters=()):
+        self._adapters = {}
+        for adapter in adapters:
+            self.register(adapter)
+
+    @classmethod
+    def for_service(cls, service, **options):
+        # one default adapter per shipping type the service accepts
+        return cls(CarrierAdapter(shipping_type, service, **options)
+                   for shipping_type in service.list_available_shipping_type())
+
+    def register(self, adapter: CarrierAdapter):
+        # replaces the adapter of the same shipping type
+        self._adapters[adapter.shipping_type] = adapter
+        return adapter
+
+    def get(self, shipping_type: str):
+        adapter = self._adapters.get(shipping_type)
+        if adapter is None:
+            raise ValueError("Shipping type is not available")
+        return adapter
+
+    @property
+    def shipping_types(self):
+        return tuple(self._adapters)
+
+    def __contains__(self, shipping_type):
+        return shipping_type in self._adapters
+
+    def __iter__(self):
+        return iter(list(self._adapters.values()))
+
+    def __len__(self):
+        return len(self._adapters)
+
+
+class _CarrierQueue:
+
+    def __init__(self, adapter):
+        self.adapter = adapter
+        self.pending = []
+        self.deadline = None
+        self.executor = ThreadPoolExecutor(max_workers=adapter.concurrency,
+                                           thread_name_prefix=f'shipping-carrier-{adapter.shipping_type}')
+
+
+class CarrierDispatcher:
+    """Groups submitted shipments by shipping type and sends them to their carrier in batches.
+
+    A carrier's batch is sent as soon as it holds ``max_batch`` shipments or
+    its oldest shipment has waited ``max_delay`` seconds. Every carrier sends
+    on its own executor with ``concurrency`` workers, so a slow carrier only
+    delays its own shipments. ``submit`` returns a Future with the
+    create_shippings result dict of the shipment; ``stop`` sends whatever is
+    still pending and waits for it.
+
+    Batches are flushed by time only while the dispatcher thread runs
+    (``start`` or ``with``); without it, only full batches and ``flush``
+    or ``flush_due`` send anything.
+    """
+
+    def __init__(self, registry: CarrierRegistry, clock=time.monotonic):
+        self.registry = registry
+        self.clock = clock
+        self.batches = 0
+        self.errors = 0
+        self._queues = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def _queue(self, shipping_type):
+        queue = self._queues.get(shipping_type)
+        if queue is None:
+            queue = self._queues[shipping_type] = _CarrierQueue(self.registry.get(shipping_type))
+        return queue
+
+    def submit(self, shipping: dict):
+        # shipping: a dict with shipping_type, product_ids, order_id and due_date, as for create_shippings
+        future = Future()
+        with self._condition:
+            if self._stopping:
+                raise RuntimeError("Carrier dispatcher is stopped")
+            queue = self._queue(shipping.get('shipping_type'))
+            queue.pending.append((shipping, future))
+            if len(queue.pending) >= queue.adapter.max_batch:
+                self._send(queue)
+            elif queue.deadline is None:
+                queue.deadline = self.clock() + queue.adapter.max_delay
+                self._condition.notify()
+        return future
+
+    def flush(self, shipping_type: str = None):
+        # sends pending shipments now instead of waiting for their deadline
+        with self._condition:
+            for queue in list(self._queues.values()):
+                if shipping_type is None or queue.adapter.shipping_type == shipping_type:
+                    self._send(queue)
+
+    def flush_due(self, now: float = None):
+        # sends the batches whose oldest shipment has waited long enough; returns the next deadline
+        now = self.clock() if now is None else now
+        with self._condition:
+            for queue in self._queues.values():
+                if queue.deadline is not None and queue.deadline <= now:
+                    self._send(queue)
+            return min((queue.deadline for queue in self._queues.values() if queue.deadline is not None),
+                       default=None)
+
+    def _send(self, queue):
+        # called with the condition held; only hands the batch to the carrier's executor
+        while queue.pending:
+            batch = queue.pending[:queue.adapter.max_batch]
+            del queue.pending[:queue.adapter.max_batch]
+            self.batches += 1
+            queue.executor.submit(self._deliver, queue.adapter, batch)
+        queue.deadline = None
+
+    def _deliver(self, adapter, batch):
+        try:
+            results = adapter.send([shipping for shipping, _ in batch])
+        except Exception as error:  # pylint: disable=broad-except
+            logger.exception("Carrier %s failed to take %d shipments", adapter.shipping_type, len(batch))
+            with self._condition:
+                self.errors += 1
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        results = list(results)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+        if len(results) != len(batch):
+            logger.error("Carrier %s returned %d results for %d shipments",
+                         adapter.shipping_type, len(results), len(batch))
+            with self._condition:
+                self.errors += 1
+            error = RuntimeError(f"Carrier {adapter.shipping_type} returned no result for this shipment")
+            for _, future in batch[len(results):]:
+                future.set_exception(error)
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError("Carrier dispatcher is already running")
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='shipping-carrier-dispatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        for queue in list(self._queues.values()):
+            queue.executor.shutdown(wait=True)
+        self._queues.clear()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _run(self):
+        # sleeps until the earliest batch deadline; submit wakes it up when a new batch starts
+        with self._condition:
+            while not self._stopping:
+                now = self.clock()
+                deadline = self.flush_due(now)
+                self._condition.wait(None if deadline is None else max(0.0, deadline - now))
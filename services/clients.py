@@ -0,0 +1,92 @@
+import threading
+
+import boto3
+from botocore.config import Config
+from .config import AWS_ENDPOINT_URL, AWS_REGION, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_MAX_POOL_CONNECTIONS, \
+    AWS_RETRY_MODE, AWS_MAX_ATTEMPTS
+
+# One session per process. Clients are thread-safe and are shared by every
+# repository/publisher, so their connection pools are reused across requests.
+# Resources are not thread-safe: every thread gets its own, wired to the shared client.
+_lock = threading.RLock()
+_session = None
+_clients = {}
+_local = threading.local()
+_generation = 0
+_queue_urls = {}
+
+
+def get_session():
+    global _session  # pylint: disable=global-statement
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.session.Session(
+                    region_name=AWS_REGION,
+                    aws_access_key_id=AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+                )
+    return _session
+
+
+def _client_config():
+    return Config(
+        max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+        retries={'mode': AWS_RETRY_MODE, 'total_max_attempts': AWS_MAX_ATTEMPTS}
+    )
+
+
+def get_client(service_name: str):
+    client = _clients.get(service_name)
+    if client is None:
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                client = get_session().client(service_name, endpoint_url=AWS_ENDPOINT_URL, config=_client_config())
+                _clients[service_name] = client
+    return client
+
+
+def get_resource(service_name: str):
+    # per thread; reset() bumps the generation, which drops the resources of every thread
+    if getattr(_local, 'generation', None) != _generation:
+        _local.generation = _generation
+        _local.resources = {}
+    resource = _local.resources.get(service_name)
+    if resource is None:
+        client = get_client(service_name)
+        with _lock:
+            # the session is not thread-safe either, so resources are built under the lock
+            resource = get_session().resource(service_name, endpoint_url=AWS_ENDPOINT_URL, config=_client_config())
+        # tables and batch writers of this resource call through the shared, pooled client
+        resource.meta.client = client
+        _local.resources[service_name] = resource
+    return resource
+
+
+def get_dynamodb_resource():
+    return get_resource("dynamodb")
+
+
+def get_sqs_client():
+    return get_client("sqs")
+
+
+def get_queue_url(queue_name: str, client=None):
+    # cached per endpoint, so an injected client for another endpoint resolves its own url
+    client = client or get_sqs_client()
+    key = (getattr(client.meta, 'endpoint_url', None), queue_name)
+    queue_url = _queue_urls.get(key)
+    if queue_url is None:
+        queue_url = client.get_queue_url(QueueName=queue_name)['QueueUrl']
+        _queue_urls[key] = queue_url
+    return queue_url
+
+
+def reset():
+    global _session, _generation  # pylint: disable=global-statement
+    with _lock:
+        _session = None
+        _generation += 1
+        _clients.clear()
+        _queue_urls.clear()
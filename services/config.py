@@ -4,5 +4,22 @@ AWS_ENDPOINT_URL = os.getenv("AWS_ENDPOINT_URL", "http://localhost:4566")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID", "test")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY", "test")
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "50"))
+# retries are made by services.resilience, so botocore only makes one attempt unless told otherwise
+AWS_RETRY_MODE = os.getenv("AWS_RETRY_MODE", "standard")
+AWS_MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", "1"))
+AWS_CALL_ATTEMPTS = int(os.getenv("AWS_CALL_ATTEMPTS", "5"))
 SHIPPING_TABLE_NAME = os.getenv("SHIPPING_TABLE_NAME", "ShippingTable")
+SHIPPING_OUTBOX_TABLE_NAME = os.getenv("SHIPPING_OUTBOX_TABLE_NAME", "ShippingOutboxTable")
 SHIPPING_QUEUE = os.getenv("SHIPPING_QUEUE", "ShippingQueue")
+# with more than one shard the queues are named ShippingQueue-0 ... ShippingQueue-<n-1>
+SHIPPING_QUEUE_SHARDS = int(os.getenv("SHIPPING_QUEUE_SHARDS", "1"))
+SHIPPING_QUEUE_FIFO = os.getenv("SHIPPING_QUEUE_FIFO", "false").lower() in ("1", "true", "yes")
+SHIPPING_VISIBILITY_TIMEOUT = int(os.getenv("SHIPPING_VISIBILITY_TIMEOUT", "30"))
+# metrics and spans of services.instrumentation, can also be switched on with instrumentation.enable()
+SHIPPING_INSTRUMENTATION = os.getenv("SHIPPING_INSTRUMENTATION", "false").lower() in ("1", "true", "yes")
+# client-side rate limits in calls per second, e.g. "ShippingTable=500,ShippingQueue=300"
+SHIPPING_RATE_LIMITS = {
+    name.strip(): float(rate)
+    for name, rate in (pair.split("=", 1) for pair in os.getenv("SHIPPING_RATE_LIMITS", "").split(",") if pair.strip())
+}
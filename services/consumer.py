@@ -0,0 +1,183 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .publisher import group_messages
+
+logger = logging.getLogger(__name__)
+
+
+class ShippingConsumer:
+    """Long-running consumer: N pollers feed a bounded pool of processors.
+
+    Pollers only receive as many messages as there are free in-flight slots,
+    so the consumer never holds more than ``max_in_flight`` messages. Processed
+    messages are deleted from the queue in batches and messages that are still
+    waiting get their visibility extended. Messages of one FIFO group are
+    processed in order by a single worker. ``stop`` stops polling and waits
+    until everything already received is processed and acknowledged.
+    """
+
+    def __init__(self, service, pollers: int = 2, workers: int = 8, max_in_flight: int = 40,
+                 batch_size: int = 10, wait_time: int = 10):
+        if pollers < 1 or workers < 1:
+            raise ValueError("Consumer needs at least one poller and one worker")
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be a positive integer")
+
+        self.service = service
+        self.pollers = pollers
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.batch_size = batch_size
+        self.wait_time = wait_time
+
+        self.processed = 0
+        self.errors = 0
+
+        self._in_flight = 0
+        self._pending = {}
+        self._done = []
+        self._capacity = threading.Condition()
+        self._stopping = threading.Event()
+        self._executor = None
+        self._threads = []
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def start(self):
+        if self._threads:
+            raise RuntimeError("Consumer is already running")
+
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shipping-worker')
+        for number in range(self.pollers):
+            thread = threading.Thread(target=self._poll_loop, name=f'shipping-poller-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        with self._capacity:
+            self._capacity.notify_all()
+
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._acknowledge()
+
+    def run_forever(self):
+        self.start()
+        try:
+            self._stopping.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _reserve(self):
+        with self._capacity:
+            if self._in_flight >= self.max_in_flight and not self._stopping.is_set():
+                # wake up periodically so the poller can keep acknowledging and extending
+                self._capacity.wait(1)
+            if self._stopping.is_set() or self._in_flight >= self.max_in_flight:
+                return 0
+
+            slots = min(self.batch_size, self.max_in_flight - self._in_flight)
+            self._in_flight += slots
+            return slots
+
+    def _release(self, slots: int):
+        if not slots:
+            return
+        with self._capacity:
+            self._in_flight -= slots
+            self._capacity.notify_all()
+
+    def _poll_loop(self):
+        while not self._stopping.is_set():
+            self._acknowledge()
+            self._extend_pending()
+
+            slots = self._reserve()
+            if not slots:
+                continue
+
+            try:
+                messages = self.service.publisher.poll_shipping(slots, self.wait_time)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Polling shipping queue failed")
+                self._release(slots)
+                self._stopping.wait(1)
+                continue
+
+            with self._capacity:
+                self._pending.update((message.receipt_handle, message) for message in messages)
+            self._release(slots - len(messages))
+            for group in group_messages(messages):
+                self._executor.submit(self._process_group, group)
+
+    def _process_group(self, messages):
+        for index, message in enumerate(messages):
+            if not self._process(message):
+                # the rest of the group is redelivered after the failed message, still in order
+                self._forget(messages[index + 1:])
+                return
+
+    def _process(self, message):
+        try:
+            self.service.process_shipping(message.shipping_id)
+        except Exception:  # pylint: disable=broad-except
+            # not acknowledged, so SQS redelivers it after the visibility timeout
+            logger.exception("Processing shipping %s failed", message.shipping_id)
+            with self._capacity:
+                self.errors += 1
+            return False
+        else:
+            with self._capacity:
+                self.processed += 1
+                self._done.append(message)
+            return True
+        finally:
+            self._forget([message])
+
+    def _forget(self, messages):
+        if not messages:
+            return
+        with self._capacity:
+            for message in messages:
+                self._pending.pop(message.receipt_handle, None)
+        self._release(len(messages))
+
+    def _extend_pending(self):
+        with self._capacity:
+            pending = list(self._pending.values())
+        if not pending:
+            return
+        try:
+            self.service.extend_expiring(pending)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Extending visibility of %d shipping messages failed", len(pending))
+
+    def _acknowledge(self):
+        with self._capacity:
+            done, self._done = self._done, []
+        if not done:
+            return
+        try:
+            self.service.publisher.acknowledge(done)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Acknowledging %d shipping messages failed", len(done))
@@ -0,0 +1,181 @@
+"""Export every shipment to a columnar file.
+
+Run with ``python -m services.export shippings.parquet``. The table is read
+with a parallel segmented scan, one thread per segment, and pages flow through
+a bounded queue to a single writer that flushes every ``chunk_size`` rows, so
+memory stays constant however large the table is. Parquet needs pyarrow;
+without it the export is written as CSV.
+"""
+
+import argparse
+import csv
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .repository import ShippingRepository
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional, only needed for Parquet
+    pyarrow = None
+
+COLUMNS = ('shipping_id', 'order_id', 'shipping_type', 'shipping_status', 'product_ids', 'created_at', 'due_at',
+           'schema_version')
+_DONE = object()
+
+
+class CsvChunkWriter:
+
+    def __init__(self, path):
+        self._file = open(path, 'w', newline='', encoding='utf-8')  # pylint: disable=consider-using-with
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, items):
+        # product ids are JSON encoded, a plain join would break on names with commas
+        self._writer.writerows(
+            [item.get(column) if column != 'product_ids' else json.dumps(item.get('product_ids', []), ensure_ascii=False)
+             for column in COLUMNS]
+            for item in items
+        )
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetChunkWriter:
+
+    def __init__(self, path):
+        if pyarrow is None:
+            raise RuntimeError("Parquet export needs pyarrow, install it or export to CSV")
+        self._schema = pyarrow.schema([
+            ('shipping_id', pyarrow.string()),
+            ('order_id', pyarrow.string()),
+            ('shipping_type', pyarrow.string()),
+            ('shipping_status', pyarrow.string()),
+            ('product_ids', pyarrow.list_(pyarrow.string())),
+            ('created_at', pyarrow.timestamp('ms', tz='UTC')),
+            ('due_at', pyarrow.timestamp('ms', tz='UTC')),
+            ('schema_version', pyarrow.int8()),
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+
+    def write(self, items):
+        # every chunk becomes one row group
+        columns = {column: [item.get(column) for item in items] for column in COLUMNS}
+        self._writer.write_table(pyarrow.table(columns, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+WRITERS = {'csv': CsvChunkWriter, 'parquet': ParquetChunkWriter}
+
+
+def export_shippings(path, repository=None, segments: int = 8, page_size: int = 1000, chunk_size: int = 10000,
+                     file_format: str = None):
+    repository = repository or ShippingRepository()
+    file_format = file_format or ('parquet' if pyarrow is not None else 'csv')
+    if file_format not in WRITERS:
+        raise ValueError(f"Unknown export format {file_format}")
+
+    pages = queue.Queue(maxsize=2 * segments)
+    stopping = threading.Event()
+    capacity_lock = threading.Lock()
+    consumed_capacity = [0.0]
+
+    def count_capacity(response):
+        with capacity_lock:
+            consumed_capacity[0] += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
+
+    def put(page):
+        # a failed writer sets stopping, so the scanners do not block on a full queue forever
+        while not stopping.is_set():
+            try:
+                pages.put(page, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def scan(segment):
+        try:
+            page = []
+            for item in repository.scan_segment(segment, segments, page_size, on_page=count_capacity):
+                page.append(item)
+                if len(page) >= page_size:
+                    put(page)
+                    page = []
+            if page:
+                put(page)
+        finally:
+            put(_DONE)
+
+    # written next to the target and renamed at the end, so readers never see a partial export
+    partial_path = f'{path}.part'
+    started = time.perf_counter()
+    exported = 0
+    writer = WRITERS[file_format](partial_path)
+    try:
+        with ThreadPoolExecutor(max_workers=segments, thread_name_prefix='shipping-export') as executor:
+            futures = [executor.submit(scan, segment) for segment in range(segments)]
+            try:
+                finished = 0
+                chunk = []
+                while finished < segments:
+                    page = pages.get()
+                    if page is _DONE:
+                        finished += 1
+                        continue
+                    chunk.extend(page)
+                    if len(chunk) >= chunk_size:
+                        writer.write(chunk)
+                        exported += len(chunk)
+                        chunk = []
+                if chunk:
+                    writer.write(chunk)
+                    exported += len(chunk)
+            finally:
+                stopping.set()
+            for future in futures:
+                future.result()
+    except BaseException:
+        writer.close()
+        os.remove(partial_path)
+        raise
+
+    writer.close()
+    os.replace(partial_path, path)
+    elapsed = time.perf_counter() - started
+    return {
+        'path': path,
+        'format': file_format,
+        'items': exported,
+        'seconds': round(elapsed, 3),
+        'items_per_sec': round(exported / elapsed, 1) if elapsed else 0.0,
+        'consumed_capacity': consumed_capacity[0],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=sorted(WRITERS), help='defaults to parquet when pyarrow is installed')
+    parser.add_argument('--segments', type=int, default=8, help='parallel scan segments (and threads)')
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--chunk-size', type=int, default=10000, help='rows per write to the file')
+    args = parser.parse_args(argv)
+
+    result = export_shippings(args.path, segments=args.segments, page_size=args.page_size,
+                              chunk_size=args.chunk_size, file_format=args.format)
+    print(f"exported {result['items']} items to {result['path']} ({result['format']}) in {result['seconds']:.1f} s, "
+          f"{result['items_per_sec']:.1f} items/s, {result['consumed_capacity']:.1f} capacity units")
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+import functools
+import inspect
+import logging
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from .config import SHIPPING_INSTRUMENTATION
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        # (le, count) pairs as Prometheus expects them, ending with +Inf
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class OperationStats:
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.batch_size = Histogram(BATCH_BUCKETS)
+        self.calls = 0
+        self.errors = 0
+        self.empty = 0
+
+
+class Span:
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.started = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def __repr__(self):
+        return f"Span({self.name!r}, duration={self.duration}, error={self.error!r})"
+
+
+class Instrumentation:
+    """Latency, call, error and batch-size metrics per operation, plus optional spans.
+
+    ``hooks`` get ``(component, operation, seconds, error, size)`` after every
+    instrumented call and ``span_hooks`` get every finished Span, so metrics
+    and traces can be forwarded elsewhere. Spans are only created while a
+    span hook is registered. A hook that raises is logged and skipped, so it
+    never fails the call it observes.
+    """
+
+    def __init__(self):
+        self.hooks = []
+        self.span_hooks = []
+        self._operations = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def record(self, component, operation, seconds, error=False, size=None, empty=False):
+        with self._lock:
+            stats = self._operations.get((component, operation))
+            if stats is None:
+                stats = self._operations[(component, operation)] = OperationStats()
+            stats.calls += 1
+            stats.latency.observe(seconds)
+            if error:
+                stats.errors += 1
+            if size is not None:
+                stats.batch_size.observe(size)
+            if empty:
+                stats.empty += 1
+        for hook in self.hooks:
+            try:
+                hook(component, operation, seconds, error, size)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Metrics hook %r failed for %s.%s", hook, component, operation)
+
+    def stats(self):
+        with self._lock:
+            return {
+                f'{component}.{operation}': {
+                    'calls': stats.calls,
+                    'errors': stats.errors,
+                    'empty': stats.empty,
+                    'seconds': round(stats.latency.sum, 6),
+                    'mean_batch_size': (stats.batch_size.sum / stats.batch_size.count
+                                        if stats.batch_size.count else None),
+                }
+                for (component, operation), stats in self._operations.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        if not _enabled or not self.span_hooks:
+            yield None
+            return
+        stack = self._local.__dict__.setdefault('spans', [])
+        current = Span(name, stack[-1] if stack else None, **attributes)
+        stack.append(current)
+        try:
+            yield current
+        except BaseException as error:
+            current.error = repr(error)
+            raise
+        finally:
+            stack.pop()
+            current.duration = time.perf_counter() - current.started
+            for hook in self.span_hooks:
+                try:
+                    hook(current)
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("Span hook %r failed for %s", hook, current.name)
+
+    def current_span(self):
+        # innermost open span of this thread, or None
+        stack = self._local.__dict__.get('spans')
+        return stack[-1] if stack else None
+
+    def render_prometheus(self):
+        with self._lock:
+            operations = sorted(self._operations.items())
+            lines = []
+            _family(lines, 'shipping_operation_seconds', 'histogram', 'Latency of shipping operations')
+            for (component, operation), stats in operations:
+                _histogram(lines, 'shipping_operation_seconds', _labels(component, operation), stats.latency)
+            _family(lines, 'shipping_operation_calls_total', 'counter', 'Calls of shipping operations')
+            for (component, operation), stats in operations:
+                lines.append(f'shipping_operation_calls_total{{{_labels(component, operation)}}} {stats.calls}')
+            _family(lines, 'shipping_operation_errors_total', 'counter', 'Shipping operations that raised')
+            for (component, operation), stats in operations:
+                lines.append(f'shipping_operation_errors_total{{{_labels(component, operation)}}} {stats.errors}')
+            _family(lines, 'shipping_batch_size', 'histogram', 'Items per batched shipping operation')
+            for (component, operation), stats in operations:
+                if stats.batch_size.count:
+                    _histogram(lines, 'shipping_batch_size', _labels(component, operation), stats.batch_size)
+            _family(lines, 'shipping_empty_polls_total', 'counter', 'Queue polls that returned no messages')
+            for (component, operation), stats in operations:
+                if stats.empty or operation == 'poll_shipping':
+                    lines.append(f'shipping_empty_polls_total{{{_labels(component, operation)}}} {stats.empty}')
+
+        resilience = sys.modules.get('services.resilience')
+        if resilience is not None:
+            # only when the AWS layer is loaded anyway, the exporter itself never imports it
+            _family(lines, 'shipping_aws_retries_total', 'counter', 'Retried AWS calls per table or queue')
+            for name, stats in sorted(resilience.policy_stats().items()):
+                lines.append(f'shipping_aws_retries_total{{policy="{_escape(name)}"}} {stats["retries"]}')
+            _family(lines, 'shipping_aws_throttled_total', 'counter', 'Throttled AWS calls per table or queue')
+            for name, stats in sorted(resilience.policy_stats().items()):
+                lines.append(f'shipping_aws_throttled_total{{policy="{_escape(name)}"}} {stats["throttled"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(component, operation):
+    return f'component="{_escape(component)}",operation="{_escape(operation)}"'
+
+
+def _family(lines, name, kind, description):
+    lines.append(f'# HELP {name} {description}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def _histogram(lines, name, labels, histogram):
+    for bound, count in histogram.cumulative():
+        bound = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+
+instrumentation = Instrumentation()
+_enabled = SHIPPING_INSTRUMENTATION
+
+
+def enable():
+    global _enabled  # pylint: disable=global-statement
+    _enabled = True
+
+
+def disable():
+    global _enabled  # pylint: disable=global-statement
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def span(name, **attributes):
+    return instrumentation.span(name, **attributes)
+
+
+def current_span():
+    return instrumentation.current_span()
+
+
+def render_prometheus():
+    return instrumentation.render_prometheus()
+
+
+def instrumented(component, batch_arg: str = None, count_result: bool = False):
+    """Record every call of the decorated method under ``component``.
+
+    ``batch_arg`` names the argument whose length is the batch size;
+    ``count_result`` uses the length of the result instead and counts empty
+    results (queue polls). Generators are timed while they produce items, so
+    the caller's own work between items is not counted. When instrumentation
+    is disabled the wrapper only checks a flag.
+    """
+
+    def decorate(function):
+        operation = function.__name__
+        batch_index = list(inspect.signature(function).parameters).index(batch_arg) if batch_arg else None
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+
+            size = None
+            if batch_index is not None:
+                if batch_arg in kwargs:
+                    batch = kwargs[batch_arg]
+                else:
+                    batch = args[batch_index] if len(args) > batch_index else None
+                size = len(batch) if hasattr(batch, '__len__') else None
+
+            if instrumentation.span_hooks:
+                with instrumentation.span(f'{component}.{operation}', batch_size=size):
+                    result, elapsed = _call(component, operation, function, args, kwargs, size)
+            else:
+                result, elapsed = _call(component, operation, function, args, kwargs, size)
+
+            if inspect.isgenerator(result):
+                return _timed(component, operation, result, elapsed)
+            if count_result:
+                size = len(result)
+                instrumentation.record(component, operation, elapsed, False, size, empty=not size)
+            else:
+                instrumentation.record(component, operation, elapsed, False, size)
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+def _call(component, operation, function, args, kwargs, size):
+    started = time.perf_counter()
+    try:
+        result = function(*args, **kwargs)
+    except Exception:
+        instrumentation.record(component, operation, time.perf_counter() - started, True, size)
+        raise
+    return result, time.perf_counter() - started
+
+
+def _timed(component, operation, items, elapsed):
+    count = 0
+    error = False
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            except Exception:
+                error = True
+                raise
+            finally:
+                elapsed += time.perf_counter() - started
+            count += 1
+            yield item
+    finally:
+        instrumentation.record(component, operation, elapsed, error, count)
@@ -0,0 +1,53 @@
+"""Rewrite legacy shipment records in the current schema.
+
+Run with ``python -m services.migrate``. The table is read with a parallel
+segmented scan, one thread per segment, and every v1 item is upgraded with a
+conditional update, so the migration can run next to live traffic and can be
+restarted at any point.
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .repository import ShippingRepository
+
+
+def migrate_segment(repository, segment: int, total_segments: int, page_size: int = 100):
+    migrated = skipped = 0
+    for item in repository.scan_segment(segment, total_segments, page_size, legacy_only=True):
+        if repository.rewrite_legacy(item):
+            migrated += 1
+        else:
+            # already rewritten by another run, or deleted since the scan
+            skipped += 1
+    return migrated, skipped
+
+
+def migrate_shippings(repository=None, segments: int = 8, page_size: int = 100):
+    repository = repository or ShippingRepository()
+    with ThreadPoolExecutor(max_workers=segments, thread_name_prefix='shipping-migrate') as executor:
+        results = list(executor.map(
+            lambda segment: migrate_segment(repository, segment, segments, page_size), range(segments)
+        ))
+    return {
+        'migrated': sum(migrated for migrated, _ in results),
+        'skipped': sum(skipped for _, skipped in results),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--segments', type=int, default=8, help='parallel scan segments (and threads)')
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    result = migrate_shippings(segments=args.segments, page_size=args.page_size)
+    elapsed = time.perf_counter() - started
+    print(f"migrated {result['migrated']} items, skipped {result['skipped']} in {elapsed:.1f} s")
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxRelay:
+    """Drains the shipping outbox to SQS in batches.
+
+    Entries are deleted only after SQS accepted their message, so delivery is
+    at-least-once; a crash between sending and deleting resends the ids, which
+    transition_status makes harmless for the consumers.
+    """
+
+    def __init__(self, repository, publisher, batch_size: int = 100, interval: float = 1.0):
+        self.repository = repository
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.interval = interval
+        self.relayed = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def relay_once(self):
+        entries = self.repository.get_outbox_batch(self.batch_size)
+        if not entries:
+            return 0
+
+        sent, failed = self.publisher.send_new_shippings(list(entries), entries)
+        if failed:
+            logger.warning("Failed to relay %d outbox entries, will retry", len(failed))
+        if sent:
+            self.repository.delete_outbox(list(sent))
+        self.relayed += len(sent)
+        return len(sent)
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError("Outbox relay is already running")
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='shipping-outbox-relay', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                relayed = self.relay_once()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Relaying shipping outbox failed")
+                relayed = 0
+            # a full batch means there is probably more waiting, so go again right away
+            if relayed < self.batch_size:
+                self._stopping.wait(self.interval)
@@ -1,36 +1,229 @@
-import boto3
-from .config import AWS_ENDPOINT_URL, AWS_REGION, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, SHIPPING_QUEUE
+import itertools
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from functools import cached_property
+
+from .clients import get_sqs_client, get_queue_url
+from .config import SHIPPING_QUEUE, SHIPPING_QUEUE_SHARDS, SHIPPING_QUEUE_FIFO, SHIPPING_VISIBILITY_TIMEOUT
+from .instrumentation import instrumented
+from .resilience import get_policy
+
+
+@dataclass
+class ShippingMessage:
+    shipping_id: str
+    receipt_handle: str
+    visible_until: float
+    queue_url: str = None
+    group_id: str = None
+
+    def expires_within(self, seconds: float):
+        return self.visible_until - time.monotonic() < seconds
+
+
+def shard_queue_names(queue_name: str = SHIPPING_QUEUE, shards: int = SHIPPING_QUEUE_SHARDS,
+                      fifo: bool = SHIPPING_QUEUE_FIFO):
+    # "ShippingQueue" for a single queue, "ShippingQueue-0" ... "ShippingQueue-<n-1>" for shards
+    names = [queue_name] if shards == 1 else [f"{queue_name}-{shard}" for shard in range(shards)]
+    return [f"{name}.fifo" for name in names] if fifo else names
+
+
+def group_messages(messages):
+    # one list per FIFO message group in receive order; messages without a group stand alone.
+    # SQS only orders a group if its messages are processed one after another
+    groups = {}
+    for message in messages:
+        groups.setdefault(message.group_id or object(), []).append(message)
+    return list(groups.values())
+
+
+def shard_for(key, shards: int):
+    # crc32 is stable across processes, unlike hash() of a str; order ids are not always strings
+    return zlib.crc32(str(key).encode('utf-8')) % shards
+
 
 class ShippingPublisher:
-    def __init__(self):
-        self.client = boto3.client(
-            "sqs",
-            endpoint_url=AWS_ENDPOINT_URL,
-            region_name=AWS_REGION,
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY
-        )
-        response = self.client.get_queue_url(QueueName=SHIPPING_QUEUE)
-        self.queue_url = response['QueueUrl']
+    """Sends shipping ids to one or more shard queues and polls the subscribed ones.
+
+    Messages are routed by ``order_id`` (the shipping id when it is unknown),
+    so every message of an order lands on the same shard. On FIFO queues the
+    order id is also the message group and the shipping id the deduplication
+    id, so SQS hands out one order's messages in sequence while different
+    orders are consumed in parallel. A single receive can still return
+    several messages of a group; consumers keep their order with
+    ``group_messages``. ``shards`` limits polling to a subset of
+    the queues; publishing always uses all of them.
+    """
+
+    SEND_BATCH_SIZE = 10
+
+    def __init__(self, visibility_timeout: int = SHIPPING_VISIBILITY_TIMEOUT, client=None, queue_url: str = None,
+                 queue_urls: list = None, shards: list = None):
+        self.visibility_timeout = visibility_timeout
+        self.shards = shards
+        self._client = client
+        self._queue_urls = [queue_url] if queue_url and queue_urls is None else queue_urls
+        self._next_queue_lock = threading.Lock()
+
+    # the client and the queue urls are resolved on first use, so building a publisher makes no calls
+    @cached_property
+    def client(self):
+        return self._client or get_sqs_client()
 
+    @cached_property
+    def queue_urls(self):
+        if self._queue_urls is not None:
+            return list(self._queue_urls)
+        return [get_queue_url(name, self.client) for name in shard_queue_names()]
 
-    def send_new_shipping(self, shipping_id: str):
-        response = self.client.send_message(
-            QueueUrl=self.queue_url,
-            MessageBody=shipping_id
+    @property
+    def queue_url(self):
+        return self.queue_urls[0]
+
+    @property
+    def fifo(self):
+        return self.queue_url.endswith('.fifo')
+
+    @cached_property
+    def subscribed(self):
+        return self.queue_urls if self.shards is None else [self.queue_urls[shard] for shard in self.shards]
+
+    @cached_property
+    def _policies(self):
+        # keyed by queue name, so the rate limit and the breaker are shared by every publisher of a queue
+        return {url: get_policy(url.rsplit('/', 1)[-1]) for url in self.queue_urls}
+
+    @cached_property
+    def _next_queue(self):
+        return itertools.cycle(self.subscribed)
+
+    def queue_for(self, shipping_id: str, order_id: str = None):
+        queue_urls = self.queue_urls
+        if len(queue_urls) == 1:
+            return queue_urls[0]
+        return queue_urls[shard_for(order_id or shipping_id, len(queue_urls))]
+
+    def _message(self, shipping_id, order_id):
+        message = {'MessageBody': shipping_id}
+        if self.fifo:
+            message['MessageGroupId'] = str(order_id or shipping_id)
+            message['MessageDeduplicationId'] = shipping_id
+        return message
+
+    @instrumented('publisher')
+    def send_new_shipping(self, shipping_id: str, order_id: str = None):
+        queue_url = self.queue_for(shipping_id, order_id)
+        response = self._policies[queue_url].call(
+            self.client.send_message,
+            QueueUrl=queue_url,
+            **self._message(shipping_id, order_id)
         )
 
         return response['MessageId']
 
-    def poll_shipping(self, batch_size: int = 10):
-        messages = self.client.receive_message(
-            QueueUrl=self.queue_url,
+    @instrumented('publisher', batch_arg='shipping_ids')
+    def send_new_shippings(self, shipping_ids: list, order_ids: dict = None):
+        # returns ({shipping_id: message_id}, {shipping_id: error}) for the whole batch;
+        # order_ids maps shipping ids to their orders for routing
+        order_ids = order_ids or {}
+        by_queue = {}
+        for shipping_id in shipping_ids:
+            by_queue.setdefault(self.queue_for(shipping_id, order_ids.get(shipping_id)), []).append(shipping_id)
+
+        sent = {}
+        failed = {}
+        for queue_url, queue_ids in by_queue.items():
+            for start in range(0, len(queue_ids), self.SEND_BATCH_SIZE):
+                chunk = queue_ids[start:start + self.SEND_BATCH_SIZE]
+                response = self._policies[queue_url].call(
+                    self.client.send_message_batch,
+                    QueueUrl=queue_url,
+                    Entries=[
+                        {'Id': str(index), **self._message(shipping_id, order_ids.get(shipping_id))}
+                        for index, shipping_id in enumerate(chunk)
+                    ]
+                )
+                for entry in response.get('Successful', []):
+                    sent[chunk[int(entry['Id'])]] = entry['MessageId']
+                for entry in response.get('Failed', []):
+                    failed[chunk[int(entry['Id'])]] = entry.get('Message', entry['Code'])
+
+        return sent, failed
+
+    @instrumented('publisher', count_result=True)
+    def poll_shipping(self, batch_size: int = 10, wait_time: int = 10):
+        # every call polls the next subscribed shard, so N pollers spread over the shards
+        with self._next_queue_lock:
+            queue_url = next(self._next_queue)
+        fifo = {'AttributeNames': ['MessageGroupId']} if self.fifo else {}
+        messages = self._policies[queue_url].call(
+            self.client.receive_message,
+            QueueUrl=queue_url,
             MessageAttributeNames=['All'],
+            **fifo,
             MaxNumberOfMessages=batch_size,
-            WaitTimeSeconds=10
+            WaitTimeSeconds=wait_time,
+            VisibilityTimeout=self.visibility_timeout
         )
 
         if 'Messages' not in messages:
             return []
 
-        return [msg['Body'] for msg in messages['Messages']]
+        visible_until = time.monotonic() + self.visibility_timeout
+        return [
+            ShippingMessage(msg['Body'], msg['ReceiptHandle'], visible_until, queue_url,
+                            msg.get('Attributes', {}).get('MessageGroupId'))
+            for msg in messages['Messages']
+        ]
+
+    def _by_queue(self, messages):
+        # receipt handles are only valid for the queue the message came from
+        by_queue = {}
+        for message in messages:
+            by_queue.setdefault(message.queue_url or self.queue_url, []).append(message)
+        for queue_url, queue_messages in by_queue.items():
+            for start in range(0, len(queue_messages), self.SEND_BATCH_SIZE):
+                yield queue_url, queue_messages[start:start + self.SEND_BATCH_SIZE]
+
+    @instrumented('publisher', batch_arg='messages')
+    def acknowledge(self, messages: list):
+        # deletes processed messages; returns the ones SQS refused to delete
+        failed = []
+        for queue_url, chunk in self._by_queue(messages):
+            response = self._policies[queue_url].call(
+                self.client.delete_message_batch,
+                QueueUrl=queue_url,
+                Entries=[
+                    {'Id': str(index), 'ReceiptHandle': message.receipt_handle}
+                    for index, message in enumerate(chunk)
+                ]
+            )
+            failed.extend(chunk[int(entry['Id'])] for entry in response.get('Failed', []))
+
+        return failed
+
+    @instrumented('publisher', batch_arg='messages')
+    def extend_visibility(self, messages: list, timeout: int = None):
+        # keeps slow messages hidden from other consumers for another `timeout` seconds
+        timeout = self.visibility_timeout if timeout is None else timeout
+        failed = []
+        for queue_url, chunk in self._by_queue(messages):
+            visible_until = time.monotonic() + timeout
+            response = self._policies[queue_url].call(
+                self.client.change_message_visibility_batch,
+                QueueUrl=queue_url,
+                Entries=[
+                    {'Id': str(index), 'ReceiptHandle': message.receipt_handle, 'VisibilityTimeout': timeout}
+                    for index, message in enumerate(chunk)
+                ]
+            )
+            failed_ids = {int(entry['Id']) for entry in response.get('Failed', [])}
+            for index, message in enumerate(chunk):
+                if index in failed_ids:
+                    failed.append(message)
+                else:
+                    message.visible_until = visible_until
+
+        return failed
@@ -1,43 +1,348 @@
-import boto3
-from .config import SHIPPING_TABLE_NAME, AWS_ENDPOINT_URL, AWS_REGION, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY
+from boto3.dynamodb.conditions import Attr, Key
+from .config import SHIPPING_TABLE_NAME, SHIPPING_OUTBOX_TABLE_NAME
 from .db import get_dynamodb_resource
+from .instrumentation import instrumented
+from .resilience import get_policy
 
+import heapq
+import itertools
+import threading
+import time
 from uuid import uuid4
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# v1 records had no schema_version, comma-joined product_ids and ISO date strings; they only
+# match the due condition through the attribute_not_exists branch until services.migrate rewrote them
+ON_TIME_CONDITION = '(due_at >= :now OR (attribute_not_exists(due_at) AND due_date >= :legacy_now))'
+OVERDUE_CONDITION = '(due_at < :now OR (attribute_not_exists(due_at) AND due_date < :legacy_now))'
 
 
 class ShippingRepository:
+    SCHEMA_VERSION = 2
+    BATCH_GET_SIZE = 100
+    BATCH_GET_ATTEMPTS = 6
+    ORDER_INDEX = 'order_id-index'
+    STATUS_DUE_AT_INDEX = 'shipping_status-due_at-index'
+    LEGACY_STATUS_DUE_DATE_INDEX = 'shipping_status-due_date-index'
 
-    def __init__(self):
-        dynamo_resource = boto3.resource(
-            "dynamodb",
-            endpoint_url=AWS_ENDPOINT_URL,
-            region_name=AWS_REGION,
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY
-        )
-        self.table = dynamo_resource.Table(SHIPPING_TABLE_NAME)
+    def __init__(self, dynamo_resource=None, read_legacy_index: bool = False):
+        self._dynamo_resource = dynamo_resource
+        # tables created before v2 still have the due_date index; status queries read it too until migrated
+        self.read_legacy_index = read_legacy_index
+        self.table_policy = get_policy(SHIPPING_TABLE_NAME)
+        self.outbox_policy = get_policy(SHIPPING_OUTBOX_TABLE_NAME)
+        self._local = threading.local()
+
+    # the resource and tables are created on first use, so building a repository costs nothing.
+    # boto3 resources are not thread-safe, so a repository shared by workers uses one per thread
+    @property
+    def dynamo_resource(self):
+        return self._dynamo_resource or get_dynamodb_resource()
+
+    @property
+    def table(self):
+        return self._table('table', SHIPPING_TABLE_NAME)
+
+    @property
+    def outbox_table(self):
+        return self._table('outbox_table', SHIPPING_OUTBOX_TABLE_NAME)
+
+    def _table(self, attribute, table_name):
+        table = getattr(self._local, attribute, None)
+        if table is None:
+            table = self.dynamo_resource.Table(table_name)
+            setattr(self._local, attribute, table)
+        return table
+
+    @staticmethod
+    def epoch_ms(value: datetime) -> int:
+        # naive datetimes are taken as UTC, like the due dates the service accepts
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return (value - EPOCH) // timedelta(milliseconds=1)
+
+    @classmethod
+    def upgrade_item(cls, item):
+        # returns the item in the current schema; numbers come back from DynamoDB as Decimal
+        if item is None:
+            return None
+        item = dict(item)
+        if "schema_version" not in item:
+            if "product_ids" in item:
+                item["product_ids"] = item["product_ids"].split(",") if item["product_ids"] else []
+            if "created_date" in item:
+                item["created_at"] = cls.epoch_ms(datetime.fromisoformat(item.pop("created_date")))
+            if "due_date" in item:
+                item["due_at"] = cls.epoch_ms(datetime.fromisoformat(item.pop("due_date")))
+            item["schema_version"] = cls.SCHEMA_VERSION
+        for key in ("schema_version", "created_at", "due_at"):
+            if key in item:
+                item[key] = int(item[key])
+        return item
+
+    @classmethod
+    def table_definition(cls, table_name: str = SHIPPING_TABLE_NAME):
+        # create_table arguments for the shipping table and the indexes the query methods rely on
+        return {
+            "TableName": table_name,
+            "KeySchema": [
+                {"AttributeName": "shipping_id", "KeyType": "HASH"}
+            ],
+            "AttributeDefinitions": [
+                {"AttributeName": "shipping_id", "AttributeType": "S"},
+                {"AttributeName": "order_id", "AttributeType": "S"},
+                {"AttributeName": "shipping_status", "AttributeType": "S"},
+                {"AttributeName": "due_at", "AttributeType": "N"},
+            ],
+            "GlobalSecondaryIndexes": [
+                {
+                    "IndexName": cls.ORDER_INDEX,
+                    "KeySchema": [
+                        {"AttributeName": "order_id", "KeyType": "HASH"}
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                },
+                {
+                    # sweeps only need ids and dates, the dashboard also shows order and carrier
+                    "IndexName": cls.STATUS_DUE_AT_INDEX,
+                    "KeySchema": [
+                        {"AttributeName": "shipping_status", "KeyType": "HASH"},
+                        {"AttributeName": "due_at", "KeyType": "RANGE"}
+                    ],
+                    "Projection": {
+                        "ProjectionType": "INCLUDE",
+                        "NonKeyAttributes": ["order_id", "shipping_type", "schema_version"],
+                    },
+                },
+            ],
+            "BillingMode": "PAY_PER_REQUEST",
+        }
 
+    @instrumented('repository')
     def get_shipping(self, shipping_id):
-        response = self.table.get_item(Key={"shipping_id": shipping_id})
-        return response.get("Item")
+        response = self.table_policy.call(self.table.get_item, Key={"shipping_id": shipping_id})
+        return self.upgrade_item(response.get("Item"))
 
-    def create_shipping(self, shipping_type: str, product_ids: list, order_id: str, status: str, due_date: datetime):
-        shipping_id = str(uuid4())
-        item = {
-            "shipping_id": shipping_id,
+    @instrumented('repository')
+    def query_by_order(self, order_id: str, page_size: int = 100):
+        items = self._paginate(
+            self.table_policy.wrap(self.table.query),
+            IndexName=self.ORDER_INDEX,
+            KeyConditionExpression=Key("order_id").eq(str(order_id)),
+            Limit=page_size
+        )
+        return (self.upgrade_item(item) for item in items)
+
+    @instrumented('repository')
+    def query_by_status(self, status: str, due_after: datetime = None, due_before: datetime = None,
+                        page_size: int = 100):
+        # due_after is inclusive, due_before exclusive; items come back ordered by due date
+        after = self.epoch_ms(due_after) if due_after else None
+        before = self.epoch_ms(due_before) if due_before else None
+        condition = Key("shipping_status").eq(status)
+        if after is not None and before is not None:
+            # only one sort key condition is allowed; between is inclusive, the key is whole milliseconds
+            condition &= Key("due_at").between(after, before - 1)
+        elif after is not None:
+            condition &= Key("due_at").gte(after)
+        elif before is not None:
+            condition &= Key("due_at").lt(before)
+
+        items = self._paginate(
+            self.table_policy.wrap(self.table.query),
+            IndexName=self.STATUS_DUE_AT_INDEX,
+            KeyConditionExpression=condition,
+            Limit=page_size
+        )
+        items = (self.upgrade_item(item) for item in items)
+        if self.read_legacy_index:
+            legacy = self._query_legacy_status(status, due_after, due_before, page_size)
+            return heapq.merge(items, legacy, key=lambda item: item["due_at"])
+        return items
+
+    def _query_legacy_status(self, status, due_after, due_before, page_size):
+        after = due_after.astimezone(timezone.utc).isoformat() if due_after else None
+        before = due_before.astimezone(timezone.utc).isoformat() if due_before else None
+        condition = Key("shipping_status").eq(status)
+        if after and before:
+            condition &= Key("due_date").between(after, before)
+        elif after:
+            condition &= Key("due_date").gte(after)
+        elif before:
+            condition &= Key("due_date").lt(before)
+
+        items = self._paginate(
+            self.table_policy.wrap(self.table.query),
+            IndexName=self.LEGACY_STATUS_DUE_DATE_INDEX,
+            KeyConditionExpression=condition,
+            Limit=page_size
+        )
+        return (self.upgrade_item(item) for item in items if item["due_date"] != before)
+
+    # not instrumented itself: query_by_status already records the call
+    def query_overdue(self, status: str, now: datetime = None, page_size: int = 100):
+        return self.query_by_status(status, due_before=now or datetime.now(timezone.utc), page_size=page_size)
+
+    @instrumented('repository')
+    def scan_segment(self, segment: int, total_segments: int, page_size: int = 100, legacy_only: bool = False,
+                     on_page=None):
+        # one worker's share of a parallel scan; items are returned in the current schema.
+        # on_page gets every raw response, with the consumed capacity included
+        kwargs = {'Segment': segment, 'TotalSegments': total_segments, 'Limit': page_size}
+        if legacy_only:
+            kwargs['FilterExpression'] = Attr('schema_version').not_exists()
+        if on_page is not None:
+            kwargs['ReturnConsumedCapacity'] = 'TOTAL'
+        items = self._paginate(self.table_policy.wrap(self.table.scan), on_page, **kwargs)
+        return (self.upgrade_item(item) for item in items)
+
+    @staticmethod
+    def _paginate(operation, on_page=None, **kwargs):
+        while True:
+            response = operation(**kwargs)
+            if on_page is not None:
+                on_page(response)
+            yield from response.get("Items", [])
+            if "LastEvaluatedKey" not in response:
+                return
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    @instrumented('repository', batch_arg='shipping_ids')
+    def get_shipping_statuses(self, shipping_ids):
+        # BatchGetItem takes at most 100 distinct keys, so duplicates are dropped before chunking
+        unique_ids = list(dict.fromkeys(shipping_ids))
+        statuses = {}
+        for start in range(0, len(unique_ids), self.BATCH_GET_SIZE):
+            request = {
+                self.table.name: {
+                    'Keys': [{'shipping_id': shipping_id} for shipping_id in unique_ids[start:start + self.BATCH_GET_SIZE]],
+                    'ProjectionExpression': 'shipping_id, shipping_status',
+                }
+            }
+            for attempt in range(self.BATCH_GET_ATTEMPTS):
+                if attempt:
+                    time.sleep(min(0.05 * 2 ** attempt, 2))
+                response = self.table_policy.call(self.dynamo_resource.batch_get_item, RequestItems=request)
+                for item in response['Responses'].get(self.table.name, []):
+                    statuses[item['shipping_id']] = item['shipping_status']
+                request = response.get('UnprocessedKeys')
+                if not request:
+                    break
+            else:
+                raise RuntimeError("Shipping statuses are still unprocessed after retries")
+
+        return statuses
+
+    @classmethod
+    def _build_item(cls, shipping_type: str, product_ids: list, order_id: str, status: str, due_date: datetime):
+        # order_id-index declares its key as a string, so numeric order ids are stored as text
+        return {
+            "shipping_id": str(uuid4()),
+            "schema_version": cls.SCHEMA_VERSION,
             "shipping_type": shipping_type,
-            "order_id": order_id,
-            "product_ids": ",".join(product_ids),
+            "order_id": str(order_id),
+            "product_ids": list(product_ids),
             "shipping_status": status,
-            "created_date": datetime.now(timezone.utc).isoformat(),
-            "due_date": due_date.replace(tzinfo=timezone.utc).isoformat()
+            "created_at": cls.epoch_ms(datetime.now(timezone.utc)),
+            "due_at": cls.epoch_ms(due_date)
         }
-        self.table.put_item(Item=item)
-        return shipping_id
 
+    @instrumented('repository')
+    def create_shipping(self, shipping_type: str, product_ids: list, order_id: str, status: str, due_date: datetime):
+        item = self._build_item(shipping_type, product_ids, order_id, status, due_date)
+        self.table_policy.call(self.table.put_item, Item=item)
+        return item["shipping_id"]
+
+    @instrumented('repository', batch_arg='shippings')
+    def create_shippings(self, shippings: list, status: str):
+        # batch_writer groups puts into BatchWriteItem calls of 25 and resends unprocessed items.
+        # Puts are idempotent, so a throttled batch is simply written again by the policy
+        items = [self._build_item(status=status, **shipping) for shipping in shippings]
+
+        def write():
+            with self.table.batch_writer() as writer:
+                for item in items:
+                    writer.put_item(Item=item)
+
+        self.table_policy.call(write)
+        return [item["shipping_id"] for item in items]
+
+    @instrumented('repository')
+    def create_shipping_with_outbox(self, shipping_type: str, product_ids: list, order_id: str, status: str,
+                                    due_date: datetime):
+        # the shipment and its outbox entry are written atomically; OutboxRelay publishes the entry later.
+        # The resource's client takes plain Python values, like the Table methods do.
+        item = self._build_item(shipping_type, product_ids, order_id, status, due_date)
+        outbox_item = {"shipping_id": item["shipping_id"], "order_id": item["order_id"], "created_at": item["created_at"]}
+        self.table_policy.call(
+            self.dynamo_resource.meta.client.transact_write_items,
+            TransactItems=[
+                {
+                    'Put': {
+                        'TableName': self.table.name,
+                        'Item': item,
+                        'ConditionExpression': 'attribute_not_exists(shipping_id)',
+                    }
+                },
+                {
+                    'Put': {
+                        'TableName': self.outbox_table.name,
+                        'Item': outbox_item,
+                    }
+                },
+            ]
+        )
+        return item["shipping_id"]
+
+    @instrumented('repository')
+    def get_outbox_batch(self, limit: int = 100):
+        # the outbox only holds unpublished entries, so scanning it stays cheap.
+        # Returns {shipping_id: order_id} so the relay can route messages by order
+        entries = {}
+        scan_kwargs = {'Limit': limit, 'ProjectionExpression': 'shipping_id, order_id'}
+        while len(entries) < limit:
+            response = self.outbox_policy.call(self.outbox_table.scan, **scan_kwargs)
+            entries.update((item["shipping_id"], item.get("order_id")) for item in response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response["LastEvaluatedKey"]
+            scan_kwargs['Limit'] = limit - len(entries)
+        return dict(itertools.islice(entries.items(), limit))
+
+    @instrumented('repository', batch_arg='shipping_ids')
+    def delete_outbox(self, shipping_ids: list):
+        def delete():
+            with self.outbox_table.batch_writer() as writer:
+                for shipping_id in shipping_ids:
+                    writer.delete_item(Key={"shipping_id": shipping_id})
+
+        self.outbox_policy.call(delete)
+
+    @instrumented('repository')
+    def rewrite_legacy(self, item):
+        # stores an upgraded v1 item in place; the status is not touched, so concurrent transitions survive
+        fields = {key: item[key] for key in ("product_ids", "created_at", "due_at") if key in item}
+        fields["schema_version"] = self.SCHEMA_VERSION
+        try:
+            self.table_policy.call(
+                self.table.update_item,
+                Key={
+                    'shipping_id': item["shipping_id"],
+                },
+                UpdateExpression=f'SET {", ".join(f"{key} = :{key}" for key in fields)} REMOVE created_date, due_date',
+                ConditionExpression='attribute_exists(shipping_id) AND attribute_not_exists(schema_version)',
+                ExpressionAttributeValues={f':{key}': value for key, value in fields.items()}
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    @instrumented('repository')
     def update_shipping_status(self, shipping_id, status):
-        response = self.table.update_item(
+        response = self.table_policy.call(
+            self.table.update_item,
             Key={
                 'shipping_id': shipping_id,
             },
@@ -47,3 +352,42 @@ class ShippingRepository:
             }
         )
         return response
+
+    @instrumented('repository')
+    def transition_status(self, shipping_id, from_statuses: list, on_time_status: str, overdue_status: str,
+                          now: datetime = None):
+        # the due date check runs inside the condition, so no read is needed and a
+        # shipment that already left from_statuses (e.g. a redelivered message) is left untouched
+        now = now or datetime.now(timezone.utc)
+        if self._update_status_if(shipping_id, on_time_status, ON_TIME_CONDITION, from_statuses, now):
+            return on_time_status
+        if self._update_status_if(shipping_id, overdue_status, OVERDUE_CONDITION, from_statuses, now):
+            return overdue_status
+        return None
+
+    @instrumented('repository')
+    def fail_overdue(self, shipping_id, from_statuses: list, overdue_status: str, now: datetime = None):
+        # one conditional update; False when the shipment is not overdue or already left from_statuses
+        now = now or datetime.now(timezone.utc)
+        return self._update_status_if(shipping_id, overdue_status, OVERDUE_CONDITION, from_statuses, now)
+
+    def _update_status_if(self, shipping_id, status, due_condition, from_statuses, now):
+        from_values = {f':from_{index}': value for index, value in enumerate(from_statuses)}
+        try:
+            self.table_policy.call(
+                self.table.update_item,
+                Key={
+                    'shipping_id': shipping_id,
+                },
+                UpdateExpression='SET shipping_status = :sh_status',
+                ConditionExpression=f'shipping_status IN ({", ".join(from_values)}) AND {due_condition}',
+                ExpressionAttributeValues={
+                    ':sh_status': status,
+                    ':now': self.epoch_ms(now),
+                    ':legacy_now': now.astimezone(timezone.utc).isoformat(),
+                    **from_values
+                }
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
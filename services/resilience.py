@@ -0,0 +1,252 @@
+import logging
+import random
+import threading
+import time
+
+from botocore.exceptions import BotoCoreError, ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+from .config import AWS_CALL_ATTEMPTS, SHIPPING_RATE_LIMITS
+
+logger = logging.getLogger(__name__)
+
+THROTTLING_CODES = frozenset({
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'ThrottlingException',
+    'Throttling',
+    'TooManyRequestsException',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'AWS.SimpleQueueService.RequestThrottled',
+})
+TRANSIENT_CODES = frozenset({
+    'InternalServerError',
+    'InternalFailure',
+    'ServiceUnavailable',
+    'RequestTimeout',
+    'RequestTimeoutException',
+})
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def classify(error):
+    # 'throttled', 'transient' or None for errors a retry cannot fix
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code')
+        if code in THROTTLING_CODES:
+            return 'throttled'
+        if code in TRANSIENT_CODES or error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500:
+            return 'transient'
+        return None
+    if isinstance(error, (BotoConnectionError, HTTPClientError)):
+        return 'transient'
+    return None
+
+
+class TokenBucket:
+    """Client-side rate limit that backs off when AWS throttles.
+
+    ``rate`` drops by half on every throttled call and grows back by one
+    percent of ``max_rate`` per successful call, so a burst finds the capacity
+    the table or queue actually has instead of hammering it.
+    """
+
+    def __init__(self, rate: float, burst: float = None, min_rate: float = None, clock=time.monotonic,
+                 sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("Rate must be a positive number")
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 20
+        self.burst = burst or max(1.0, rate)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        # the tokens are taken up front, so callers queue up in order instead of racing for refills
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            self.sleep(wait)
+        return wait
+
+    def throttled(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def succeeded(self):
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                # let a single probe through; its outcome closes or reopens the circuit
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+                return True
+            return False
+
+
+class ResiliencePolicy:
+    """Rate limit, retries with jittered backoff and a circuit breaker for one table or queue.
+
+    Only throttling and transient errors are retried. Errors such as a failed
+    condition, or any non-AWS exception, are raised immediately and count
+    as a healthy response. The
+    breaker opens after ``failure_threshold`` calls in a row ran out of
+    attempts, and then fails calls fast with CircuitOpenError for
+    ``reset_timeout`` seconds.
+    """
+
+    def __init__(self, name: str, rate: float = None, burst: float = None, max_attempts: int = AWS_CALL_ATTEMPTS,
+                 base_delay: float = 0.05, max_delay: float = 2.0, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, clock=time.monotonic, sleep=time.sleep, rng=None):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be a positive integer")
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.bucket = TokenBucket(rate, burst, clock=clock, sleep=sleep) if rate else None
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock)
+        self._rng = rng or random.Random()
+        self._metrics_lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.rejected = 0
+        self.rate_limited_seconds = 0.0
+
+    def backoff(self, attempt: int):
+        # "full jitter": spreads the retries of a burst instead of sending them back in lockstep
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def wrap(self, operation):
+        def call(*args, **kwargs):
+            return self.call(operation, *args, **kwargs)
+        return call
+
+    def call(self, operation, *args, **kwargs):
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise CircuitOpenError(f"Circuit for {self.name} is open after repeated failures")
+        self._count('calls')
+
+        for attempt in range(1, self.max_attempts + 1):
+            if self.bucket is not None:
+                waited = self.bucket.acquire()
+                if waited:
+                    self._count('rate_limited_seconds', waited)
+            try:
+                result = operation(*args, **kwargs)
+            except (BotoCoreError, ClientError) as error:
+                kind = classify(error)
+                if kind is None:
+                    self.breaker.record_success()
+                    raise
+                if kind == 'throttled':
+                    self._count('throttled')
+                    if self.bucket is not None:
+                        self.bucket.throttled()
+                if attempt == self.max_attempts:
+                    self._count('failures')
+                    if self.breaker.record_failure():
+                        logger.warning("Circuit for %s opened: %s", self.name, error)
+                    raise
+                self._count('retries')
+                self.sleep(self.backoff(attempt))
+            except Exception:
+                # not an AWS failure (a bug in the wrapped code): the call reached no verdict on
+                # the service, but a half-open probe still has to settle the circuit
+                self.breaker.record_success()
+                raise
+            else:
+                self.breaker.record_success()
+                if self.bucket is not None:
+                    self.bucket.succeeded()
+                return result
+        raise AssertionError("unreachable")
+
+    def _count(self, metric, value=1):
+        with self._metrics_lock:
+            setattr(self, metric, getattr(self, metric) + value)
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'rate_limited_seconds': round(self.rate_limited_seconds, 3),
+            'rate': self.bucket.rate if self.bucket is not None else None,
+            'circuit': self.breaker.state,
+        }
+
+
+# one policy per table or queue, shared by every repository and publisher in the process
+_lock = threading.Lock()
+_policies = {}
+
+
+def get_policy(name: str):
+    policy = _policies.get(name)
+    if policy is None:
+        with _lock:
+            policy = _policies.get(name)
+            if policy is None:
+                policy = _policies[name] = ResiliencePolicy(name, rate=SHIPPING_RATE_LIMITS.get(name))
+    return policy
+
+
+def policy_stats():
+    return {name: policy.stats() for name, policy in list(_policies.items())}
+
+
+def reset():
+    with _lock:
+        _policies.clear()
@@ -1,6 +1,9 @@
 from .repository import ShippingRepository
 from .publisher import ShippingPublisher
 from datetime import datetime, timezone
+from botocore.exceptions import BotoCoreError, ClientError
+from .instrumentation import current_span, instrumented
+from .resilience import CircuitOpenError
 
 
 class ShippingService:
@@ -8,50 +11,181 @@ class ShippingService:
     SHIPPING_IN_PROGRESS: str = 'in progress'
     SHIPPING_COMPLETED: str = 'completed'
     SHIPPING_FAILED: str = 'failed'
+    CREATE_BATCH_SIZE: int = 25
+    SHIPPING_TYPES: tuple = ('Нова Пошта', 'Укр Пошта', 'Meest Express', 'Самовивіз')
+    _SHIPPING_TYPE_SET: frozenset = frozenset(SHIPPING_TYPES)
+    # the keys every create_shippings record must have, and the only ones it may have
+    _SHIPPING_FIELDS: frozenset = frozenset({'shipping_type', 'product_ids', 'order_id', 'due_date'})
 
-    def __init__(self, repository, publisher):
+    def __init__(self, repository, publisher, use_outbox: bool = False):
         self.repository = repository
         self.publisher = publisher
+        self.use_outbox = use_outbox
+        # set by a running OverdueShippingSweeper so new shipments join its deadline heap
+        self.sweeper = None
+
+    @classmethod
+    def from_clients(cls, dynamo_resource=None, sqs_client=None, queue_url=None, shards=None):
+        # anything not injected comes from the process-wide pooled clients;
+        # shards limits the consumers of this service to some of the shard queues
+        return cls(
+            ShippingRepository(dynamo_resource),
+            ShippingPublisher(client=sqs_client, queue_url=queue_url, shards=shards)
+        )
 
     @staticmethod
     def list_available_shipping_type():
-        return ['Нова Пошта', 'Укр Пошта', 'Meest Express', 'Самовивіз']
+        # the same immutable tuple every call, nothing is built per request
+        return ShippingService.SHIPPING_TYPES
 
+    @instrumented('service')
     def create_shipping(self, shipping_type, product_ids, order_id, due_date):
-        if shipping_type not in self.list_available_shipping_type():
+        span = current_span()
+        if span is not None:
+            span.set_attribute('order_id', order_id)
+        if shipping_type not in self._SHIPPING_TYPE_SET:
             raise ValueError("Shipping type is not available")
 
         if due_date <= datetime.now(timezone.utc):
             raise ValueError("Shipping due datetime must be greater than datetime now")
 
-        shipping_id = self.repository.create_shipping(shipping_type, product_ids, order_id, self.SHIPPING_CREATED, due_date)
-
-        self.publisher.send_new_shipping(shipping_id)
-        self.repository.update_shipping_status(shipping_id, self.SHIPPING_IN_PROGRESS)
-
+        if self.use_outbox:
+            # one transactional write on the request path, the message is sent by OutboxRelay
+            shipping_id = self.repository.create_shipping_with_outbox(
+                shipping_type, product_ids, order_id, self.SHIPPING_IN_PROGRESS, due_date
+            )
+        else:
+            shipping_id = self.repository.create_shipping(
+                shipping_type, product_ids, order_id, self.SHIPPING_CREATED, due_date
+            )
+            self.publisher.send_new_shipping(shipping_id, order_id)
+            self.repository.update_shipping_status(shipping_id, self.SHIPPING_IN_PROGRESS)
+
+        if self.sweeper is not None:
+            self.sweeper.track(shipping_id, due_date)
         return shipping_id
 
+    @instrumented('service', batch_arg='batch')
+    def create_shippings(self, batch):
+        # batch: iterable of dicts with shipping_type, product_ids, order_id and due_date.
+        # Records are written straight in "in progress" and published in batches, so N orders
+        # cost about N/25 + N/10 calls instead of 3N. Failures are reported per order.
+        results = []
+        valid = []
+        for shipping in batch:
+            result = {'order_id': shipping.get('order_id'), 'shipping_id': None, 'error': None}
+            results.append(result)
+            unknown = shipping.keys() - self._SHIPPING_FIELDS
+            if unknown:
+                result['error'] = f"Unknown shipping fields: {', '.join(sorted(map(str, unknown)))}"
+            elif shipping.get('order_id') is None:
+                result['error'] = "Shipping order id is required"
+            elif shipping.get('product_ids') is None:
+                result['error'] = "Shipping product ids are required"
+            elif shipping.get('shipping_type') not in self._SHIPPING_TYPE_SET:
+                result['error'] = "Shipping type is not available"
+            elif shipping.get('due_date') is None:
+                result['error'] = "Shipping due datetime is required"
+            elif shipping['due_date'] <= datetime.now(timezone.utc):
+                result['error'] = "Shipping due datetime must be greater than datetime now"
+            else:
+                valid.append((result, shipping))
+
+        written = {}
+        for start in range(0, len(valid), self.CREATE_BATCH_SIZE):
+            chunk = valid[start:start + self.CREATE_BATCH_SIZE]
+            try:
+                shipping_ids = self.repository.create_shippings(
+                    [shipping for _, shipping in chunk], self.SHIPPING_IN_PROGRESS
+                )
+            except (BotoCoreError, ClientError, CircuitOpenError) as error:
+                for result, _ in chunk:
+                    result['error'] = str(error)
+                continue
+            for (result, shipping), shipping_id in zip(chunk, shipping_ids):
+                result['shipping_id'] = shipping_id
+                written[shipping_id] = shipping['order_id']
+                if self.sweeper is not None:
+                    self.sweeper.track(shipping_id, shipping['due_date'])
+
+        if written:
+            try:
+                _, failed = self.publisher.send_new_shippings(list(written), written)
+            except (BotoCoreError, ClientError, CircuitOpenError) as error:
+                failed = dict.fromkeys(written, str(error))
+            for result in results:
+                if result['shipping_id'] in failed:
+                    # not queued, so leave it as created like the single-order path does
+                    result['error'] = failed[result['shipping_id']]
+                    try:
+                        self.repository.update_shipping_status(result['shipping_id'], self.SHIPPING_CREATED)
+                    except (BotoCoreError, ClientError, CircuitOpenError):
+                        # still reported; the overdue sweeper fails it once it is due
+                        pass
+
+        return results
+
+    @instrumented('service', count_result=True)
     def process_shipping_batch(self):
         result = []
-        shipping = self.publisher.poll_shipping()
-        for shipping_id in shipping:
-            shipping = self.process_shipping(shipping_id)
-            result.append(shipping)
+        messages = self.publisher.poll_shipping()
+        processed = []
+        try:
+            for index, message in enumerate(messages):
+                self.extend_expiring(messages[index:])
+                shipping = self.process_shipping(message.shipping_id)
+                result.append(shipping)
+                processed.append(message)
+        finally:
+            if processed:
+                self.publisher.acknowledge(processed)
 
         return result
 
-    def process_shipping(self, shipping_id):
-        shipping = self.repository.get_shipping(shipping_id)
-        if datetime.fromisoformat(shipping['due_date']) < datetime.now(timezone.utc):
-            return self.fail_shipping(shipping_id)
-
-        return self.complete_shipping(shipping_id)
+    def extend_expiring(self, messages):
+        # extend visibility before half of the timeout is left so nobody else picks them up
+        expiring = [m for m in messages if m.expires_within(self.publisher.visibility_timeout / 2)]
+        if expiring:
+            self.publisher.extend_visibility(expiring)
 
+    @instrumented('service')
+    def process_shipping(self, shipping_id):
+        # returns the new status, or None when the shipment was already processed
+        return self.repository.transition_status(
+            shipping_id,
+            [self.SHIPPING_CREATED, self.SHIPPING_IN_PROGRESS],
+            self.SHIPPING_COMPLETED,
+            self.SHIPPING_FAILED
+        )
+
+    @instrumented('service')
+    def fail_overdue_shipping(self, shipping_id, now=None):
+        # True when the shipment was still open and past its due date
+        return self.repository.fail_overdue(
+            shipping_id,
+            [self.SHIPPING_CREATED, self.SHIPPING_IN_PROGRESS],
+            self.SHIPPING_FAILED,
+            now
+        )
+
+    def list_order_shippings(self, order_id):
+        return list(self.repository.query_by_order(str(order_id)))
+
+    def list_overdue_shippings(self, now=None):
+        return self.repository.query_overdue(self.SHIPPING_IN_PROGRESS, now)
+
+    @instrumented('service')
     def check_status(self, shipping_id):
         shipping = self.repository.get_shipping(shipping_id)
 
         return shipping['shipping_status']
 
+    @instrumented('service', batch_arg='shipping_ids')
+    def check_statuses(self, shipping_ids):
+        # unknown shipping ids map to None
+        statuses = self.repository.get_shipping_statuses(shipping_ids)
+        return {shipping_id: statuses.get(shipping_id) for shipping_id in shipping_ids}
+
     def fail_shipping(self, shipping_id):
         response = self.repository.update_shipping_status(shipping_id, self.SHIPPING_FAILED)
         return response['ResponseMetadata']
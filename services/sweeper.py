@@ -0,0 +1,172 @@
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from .repository import ShippingRepository
+
+logger = logging.getLogger(__name__)
+
+
+class OverdueShippingSweeper:
+    """Fails shipments whose due date has passed without waiting for their message.
+
+    Upcoming due dates are kept in a min-heap, so the sweeper thread sleeps
+    until exactly the next deadline instead of polling. The heap is filled by
+    ``refresh`` (a GSI query for shipments due within ``horizon``, which also
+    sweeps anything already overdue) and by ShippingService, which reports new
+    shipments through ``service.sweeper`` while the sweeper is running. Expired
+    shipments are failed with conditional updates in parallel chunks, so one
+    that was completed in the meantime is left alone.
+    """
+
+    def __init__(self, service, workers: int = 4, batch_size: int = 25, refresh_interval: float = 60.0,
+                 horizon: float = None):
+        if workers < 1 or batch_size < 1:
+            raise ValueError("Sweeper needs at least one worker and a positive batch size")
+
+        self.service = service
+        self.workers = workers
+        self.batch_size = batch_size
+        self.refresh_interval = refresh_interval
+        # shipments due later than this are left to a later refresh, which bounds the heap
+        self.horizon = 2 * refresh_interval if horizon is None else horizon
+        if self.horizon < refresh_interval:
+            raise ValueError("horizon must cover at least one refresh interval")
+
+        self.failed = 0
+
+        self._heap = []
+        self._tracked = {}
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._executor = None
+        self._thread = None
+
+    @property
+    def tracked(self):
+        return len(self._tracked)
+
+    def track(self, shipping_id, due_date: datetime):
+        self._track(shipping_id, ShippingRepository.epoch_ms(due_date))
+
+    def _track(self, shipping_id, due_at: int):
+        # the heap is keyed by the stored due_at, so it expires exactly when the update condition does
+        if due_at > (time.time() + self.horizon) * 1000:
+            return
+        with self._wakeup:
+            self._tracked[shipping_id] = due_at
+            heapq.heappush(self._heap, (due_at, shipping_id))
+            if self._heap[0][1] == shipping_id:
+                # new earliest deadline, the sleeping thread has to recompute its timeout
+                self._wakeup.notify_all()
+
+    def refresh(self, now: datetime = None):
+        now = now or datetime.now(timezone.utc)
+        statuses = (self.service.SHIPPING_CREATED, self.service.SHIPPING_IN_PROGRESS)
+
+        overdue = []
+        for status in statuses:
+            overdue.extend(item['shipping_id'] for item in self.service.repository.query_overdue(status, now))
+        for status in statuses:
+            upcoming = self.service.repository.query_by_status(
+                status, due_after=now, due_before=now + timedelta(seconds=self.horizon)
+            )
+            for item in upcoming:
+                self._track(item['shipping_id'], item['due_at'])
+
+        return self.sweep(overdue, now)
+
+    def sweep_due(self, now: datetime = None):
+        now = now or datetime.now(timezone.utc)
+        deadline = ShippingRepository.epoch_ms(now)
+        expired = []
+        with self._wakeup:
+            while self._heap and self._heap[0][0] < deadline:
+                due, shipping_id = heapq.heappop(self._heap)
+                # a shipment tracked twice keeps only its latest entry
+                if self._tracked.get(shipping_id) == due:
+                    del self._tracked[shipping_id]
+                    expired.append(shipping_id)
+        return self.sweep(expired, now)
+
+    def sweep(self, shipping_ids, now: datetime = None):
+        if not shipping_ids:
+            return 0
+        now = now or datetime.now(timezone.utc)
+        chunks = [shipping_ids[start:start + self.batch_size] for start in range(0, len(shipping_ids), self.batch_size)]
+
+        if self._executor is None:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                failed = sum(executor.map(lambda chunk: self._fail_chunk(chunk, now), chunks))
+        else:
+            failed = sum(self._executor.map(lambda chunk: self._fail_chunk(chunk, now), chunks))
+
+        with self._wakeup:
+            self.failed += failed
+        return failed
+
+    def _fail_chunk(self, shipping_ids, now):
+        failed = 0
+        for shipping_id in shipping_ids:
+            try:
+                if self.service.fail_overdue_shipping(shipping_id, now):
+                    failed += 1
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failing overdue shipping %s failed", shipping_id)
+        return failed
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError("Sweeper is already running")
+
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shipping-sweeper-worker')
+        self.service.sweeper = self
+        self._thread = threading.Thread(target=self._run, name='shipping-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.service.sweeper is self:
+            self.service.sweeper = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _run(self):
+        next_refresh = 0
+        while not self._stopping.is_set():
+            if time.time() >= next_refresh:
+                try:
+                    self.refresh()
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("Refreshing overdue shippings failed")
+                next_refresh = time.time() + self.refresh_interval
+
+            try:
+                self.sweep_due()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Sweeping overdue shippings failed")
+
+            with self._wakeup:
+                # due_at is overdue once the clock reaches the next millisecond
+                wake_at = min(next_refresh, (self._heap[0][0] + 1) / 1000) if self._heap else next_refresh
+                timeout = wake_at - time.time()
+                if timeout > 0 and not self._stopping.is_set():
+                    self._wakeup.wait(timeout)
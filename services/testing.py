@@ -0,0 +1,221 @@
+"""In-memory stand-ins for ShippingRepository and ShippingPublisher.
+
+They keep the same interface and return shapes as the DynamoDB/SQS backed
+classes, so ShippingService, the consumer, export, migration, the tests and
+the benchmarks can run without LocalStack. ``latency`` adds a fixed delay (in seconds) to every emulated
+network call; batch calls pay it once per AWS request they would make.
+"""
+
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from .publisher import ShippingMessage, ShippingPublisher
+from .repository import ShippingRepository
+
+
+class FakeShippingRepository:
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.items = {}
+        self.outbox = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._calls_lock = threading.Lock()
+
+    def _network_call(self):
+        with self._calls_lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_shipping(self, shipping_id):
+        self._network_call()
+        item = self.items.get(shipping_id)
+        return dict(item) if item else None
+
+    def get_shipping_statuses(self, shipping_ids):
+        unique_ids = list(dict.fromkeys(shipping_ids))
+        for _ in range(0, len(unique_ids), ShippingRepository.BATCH_GET_SIZE):
+            self._network_call()
+        return {
+            shipping_id: self.items[shipping_id]['shipping_status']
+            for shipping_id in unique_ids if shipping_id in self.items
+        }
+
+    def query_by_order(self, order_id, page_size=100):
+        return self._paged([item for item in list(self.items.values()) if item['order_id'] == str(order_id)], page_size)
+
+    def query_by_status(self, status, due_after=None, due_before=None, page_size=100):
+        after = ShippingRepository.epoch_ms(due_after) if due_after else None
+        before = ShippingRepository.epoch_ms(due_before) if due_before else None
+        items = sorted(
+            (item for item in list(self.items.values())
+             if item['shipping_status'] == status
+             and (after is None or item['due_at'] >= after)
+             and (before is None or item['due_at'] < before)),
+            key=lambda item: item['due_at']
+        )
+        return self._paged(items, page_size)
+
+    def query_overdue(self, status, now=None, page_size=100):
+        return self.query_by_status(status, due_before=now or datetime.now(timezone.utc), page_size=page_size)
+
+    def scan_segment(self, segment, total_segments, page_size=100, legacy_only=False, on_page=None):
+        items = [
+            item for index, item in enumerate(list(self.items.values()))
+            if index % total_segments == segment and not (legacy_only and 'schema_version' in item)
+        ]
+        return (ShippingRepository.upgrade_item(item) for item in self._paged(items, page_size, on_page))
+
+    def _paged(self, items, page_size, on_page=None):
+        # on_page gets a Scan/Query shaped response per page, like ShippingRepository._paginate
+        for start in range(0, max(len(items), 1), page_size):
+            self._network_call()
+            page = [dict(item) for item in items[start:start + page_size]]
+            if on_page is not None:
+                on_page({'Items': page, 'Count': len(page)})
+            yield from page
+
+    def create_shipping(self, shipping_type, product_ids, order_id, status, due_date):
+        self._network_call()
+        item = ShippingRepository._build_item(shipping_type, product_ids, order_id, status, due_date)
+        with self._lock:
+            self.items[item['shipping_id']] = item
+        return item['shipping_id']
+
+    def create_shippings(self, shippings, status):
+        items = [ShippingRepository._build_item(status=status, **shipping) for shipping in shippings]
+        for _ in range(0, len(items), 25):  # batch_writer flushes every 25 puts
+            self._network_call()
+        with self._lock:
+            for item in items:
+                self.items[item['shipping_id']] = item
+        return [item['shipping_id'] for item in items]
+
+    def create_shipping_with_outbox(self, shipping_type, product_ids, order_id, status, due_date):
+        self._network_call()
+        item = ShippingRepository._build_item(shipping_type, product_ids, order_id, status, due_date)
+        with self._lock:
+            self.items[item['shipping_id']] = item
+            self.outbox[item['shipping_id']] = item['order_id']
+        return item['shipping_id']
+
+    def get_outbox_batch(self, limit=100):
+        self._network_call()
+        with self._lock:
+            return dict(list(self.outbox.items())[:limit])
+
+    def delete_outbox(self, shipping_ids):
+        for _ in range(0, len(shipping_ids), 25):
+            self._network_call()
+        with self._lock:
+            for shipping_id in shipping_ids:
+                self.outbox.pop(shipping_id, None)
+
+    def rewrite_legacy(self, item):
+        self._network_call()
+        with self._lock:
+            stored = self.items.get(item['shipping_id'])
+            if stored is None or 'schema_version' in stored:
+                return False
+            stored.pop('created_date', None)
+            stored.pop('due_date', None)
+            stored.update({key: item[key] for key in ('product_ids', 'created_at', 'due_at') if key in item})
+            stored['schema_version'] = ShippingRepository.SCHEMA_VERSION
+        return True
+
+    def update_shipping_status(self, shipping_id, status):
+        self._network_call()
+        with self._lock:
+            self.items.setdefault(shipping_id, {'shipping_id': shipping_id})['shipping_status'] = status
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def transition_status(self, shipping_id, from_statuses, on_time_status, overdue_status, now=None):
+        now = ShippingRepository.epoch_ms(now or datetime.now(timezone.utc))
+        with self._lock:
+            item = self.items.get(shipping_id)
+            if item is None or item['shipping_status'] not in from_statuses:
+                status = None
+            elif item['due_at'] >= now:
+                status = item['shipping_status'] = on_time_status
+            else:
+                status = item['shipping_status'] = overdue_status
+
+        # one conditional update when on time, a second one otherwise
+        self._network_call()
+        if status != on_time_status:
+            self._network_call()
+        return status
+
+    def fail_overdue(self, shipping_id, from_statuses, overdue_status, now=None):
+        now = ShippingRepository.epoch_ms(now or datetime.now(timezone.utc))
+        self._network_call()
+        with self._lock:
+            item = self.items.get(shipping_id)
+            if item is None or item['shipping_status'] not in from_statuses or item['due_at'] >= now:
+                return False
+            item['shipping_status'] = overdue_status
+        return True
+
+
+class FakeShippingPublisher:
+
+    def __init__(self, latency: float = 0.0, visibility_timeout: int = 30):
+        self.latency = latency
+        self.visibility_timeout = visibility_timeout
+        self.queue = deque()
+        self.in_flight = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._calls_lock = threading.Lock()
+
+    def _network_call(self):
+        with self._calls_lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def send_new_shipping(self, shipping_id, order_id=None):  # pylint: disable=unused-argument
+        self._network_call()
+        message_id = str(uuid4())
+        with self._lock:
+            self.queue.append(shipping_id)
+        return message_id
+
+    def send_new_shippings(self, shipping_ids, order_ids=None):  # pylint: disable=unused-argument
+        for _ in range(0, len(shipping_ids), ShippingPublisher.SEND_BATCH_SIZE):
+            self._network_call()
+        with self._lock:
+            self.queue.extend(shipping_ids)
+        return {shipping_id: str(uuid4()) for shipping_id in shipping_ids}, {}
+
+    def poll_shipping(self, batch_size=10, wait_time=10):  # pylint: disable=unused-argument
+        self._network_call()
+        visible_until = time.monotonic() + self.visibility_timeout
+        messages = []
+        with self._lock:
+            while self.queue and len(messages) < batch_size:
+                message = ShippingMessage(self.queue.popleft(), str(uuid4()), visible_until)
+                self.in_flight[message.receipt_handle] = message
+                messages.append(message)
+        return messages
+
+    def acknowledge(self, messages):
+        for _ in range(0, len(messages), ShippingPublisher.SEND_BATCH_SIZE):
+            self._network_call()
+        with self._lock:
+            for message in messages:
+                self.in_flight.pop(message.receipt_handle, None)
+        return []
+
+    def extend_visibility(self, messages, timeout=None):
+        for _ in range(0, len(messages), ShippingPublisher.SEND_BATCH_SIZE):
+            self._network_call()
+        visible_until = time.monotonic() + (self.visibility_timeout if timeout is None else timeout)
+        for message in messages:
+            message.visible_until = visible_until
+        return []
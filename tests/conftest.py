@@ -1,7 +1,9 @@
 import pytest
 import boto3
+from services.publisher import shard_queue_names
+from services.repository import ShippingRepository
 from services.config import AWS_ENDPOINT_URL, AWS_REGION, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, SHIPPING_TABLE_NAME, \
-    SHIPPING_QUEUE
+    SHIPPING_QUEUE_FIFO, SHIPPING_OUTBOX_TABLE_NAME
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -16,8 +18,11 @@ def setup_localstack_resources():
 
     existing_tables = dynamo_client.list_tables()["TableNames"]
     if SHIPPING_TABLE_NAME not in existing_tables:
+        dynamo_client.create_table(**ShippingRepository.table_definition(SHIPPING_TABLE_NAME))
+
+    if SHIPPING_OUTBOX_TABLE_NAME not in existing_tables:
         dynamo_client.create_table(
-            TableName=SHIPPING_TABLE_NAME,
+            TableName=SHIPPING_OUTBOX_TABLE_NAME,
             KeySchema=[
                 {"AttributeName": "shipping_id", "KeyType": "HASH"}
             ],
@@ -28,6 +33,7 @@ def setup_localstack_resources():
         )
 
     dynamo_client.get_waiter("table_exists").wait(TableName=SHIPPING_TABLE_NAME)
+    dynamo_client.get_waiter("table_exists").wait(TableName=SHIPPING_OUTBOX_TABLE_NAME)
 
     sqs_client = boto3.client(
         "sqs",
@@ -37,14 +43,19 @@ def setup_localstack_resources():
         aws_secret_access_key=AWS_SECRET_ACCESS_KEY
     )
 
-    response = sqs_client.create_queue(QueueName=SHIPPING_QUEUE)
-    queue_url = response["QueueUrl"]
+    attributes = {"FifoQueue": "true"} if SHIPPING_QUEUE_FIFO else {}
+    queue_urls = [
+        sqs_client.create_queue(QueueName=name, Attributes=attributes)["QueueUrl"]
+        for name in shard_queue_names()
+    ]
 
     yield  # Дочекайся завершення всіх тестів
 
     # Очистка після тестування
     dynamo_client.delete_table(TableName=SHIPPING_TABLE_NAME)
-    sqs_client.delete_queue(QueueUrl=queue_url)
+    dynamo_client.delete_table(TableName=SHIPPING_OUTBOX_TABLE_NAME)
+    for queue_url in queue_urls:
+        sqs_client.delete_queue(QueueUrl=queue_url)
 
 
 @pytest.fixture(scope="session")
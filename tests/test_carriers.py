@@ -0,0 +1,95 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services import ShippingService
+from services.carriers import CarrierAdapter, CarrierDispatcher, CarrierRegistry
+from services.testing import FakeShippingPublisher, FakeShippingRepository
+
+
+class BlockedCarrier(CarrierAdapter):
+
+    def __init__(self, shipping_type, service):
+        super().__init__(shipping_type, service, max_batch=1, concurrency=1)
+        self.release = threading.Event()
+
+    def send(self, batch):
+        self.release.wait(5)
+        return super().send(batch)
+
+
+def make_service():
+    return ShippingService(FakeShippingRepository(), FakeShippingPublisher())
+
+
+def shipping(shipping_type, order_id):
+    return {'shipping_type': shipping_type, 'product_ids': ['Product'], 'order_id': order_id,
+            'due_date': datetime.now(timezone.utc) + timedelta(minutes=5)}
+
+
+def test_shipping_types_are_shared_and_checked():
+    """Типи доставки повертаються одним незмінним кортежем і перевіряються реєстром."""
+    service = make_service()
+    registry = CarrierRegistry.for_service(service)
+
+    assert service.list_available_shipping_type() is service.list_available_shipping_type()
+    assert registry.shipping_types == ShippingService.SHIPPING_TYPES
+    with pytest.raises(ValueError):
+        CarrierDispatcher(registry).submit(shipping("Голуби", "order"))
+
+
+def test_dispatcher_batches_by_carrier():
+    """Доставки групуються за перевізником і відправляються повними пакетами або примусово."""
+    service = make_service()
+    nova, ukr = ShippingService.SHIPPING_TYPES[:2]
+    dispatcher = CarrierDispatcher(CarrierRegistry.for_service(service, max_batch=3, max_delay=60))
+
+    futures = [dispatcher.submit(shipping(nova if i % 2 else ukr, f"order_{i}")) for i in range(7)]
+    results = [future.result(timeout=5) for future in futures[:6]]
+    assert dispatcher.batches == 2
+    assert not futures[6].done()
+
+    dispatcher.stop()
+    results.append(futures[6].result(timeout=0))
+    assert [result['order_id'] for result in results] == [f"order_{i}" for i in range(7)]
+    assert all(service.check_status(result['shipping_id']) == service.SHIPPING_IN_PROGRESS for result in results)
+    assert dispatcher.batches == 3
+
+
+def test_slow_carrier_does_not_stall_others():
+    """Повільний перевізник затримує лише свої доставки, а інші відправляються за часом."""
+    service = make_service()
+    registry = CarrierRegistry.for_service(service, max_delay=0.01)
+    slow = registry.register(BlockedCarrier(ShippingService.SHIPPING_TYPES[0], service))
+
+    with CarrierDispatcher(registry) as dispatcher:
+        stuck = [dispatcher.submit(shipping(slow.shipping_type, f"slow_{i}")) for i in range(2)]
+        fast = dispatcher.submit(shipping(ShippingService.SHIPPING_TYPES[1], "fast"))
+
+        assert fast.result(timeout=2)['shipping_id']
+        assert not any(future.done() for future in stuck)
+        slow.release.set()
+
+    assert all(future.result(timeout=0)['shipping_id'] for future in stuck)
+
+
+def test_short_carrier_reply_fails_the_rest_of_the_batch():
+    """Якщо перевізник повернув менше результатів, ніж доставок, решта Future завершуються помилкою."""
+    service = make_service()
+
+    class LossyCarrier(CarrierAdapter):
+
+        def send(self, batch):
+            return super().send(batch)[:1]
+
+    registry = CarrierRegistry([LossyCarrier(ShippingService.SHIPPING_TYPES[0], service, max_batch=3)])
+    dispatcher = CarrierDispatcher(registry)
+    futures = [dispatcher.submit(shipping(ShippingService.SHIPPING_TYPES[0], f"order_{i}")) for i in range(3)]
+
+    assert futures[0].result(timeout=5)['order_id'] == "order_0"
+    for future in futures[1:]:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    dispatcher.stop()
+    assert dispatcher.errors == 1
@@ -0,0 +1,72 @@
+import subprocess
+import sys
+
+from app.eshop import Product, ShoppingCart
+from app.inventory import inventory
+
+
+def test_add_products_reports_each_line():
+    """Масове додавання повертає звіт по рядках замість винятку на першій помилці."""
+    phone = Product(name="Phone", price=500.0, available_amount=5)
+    case = Product(name="Case", price=20.0, available_amount=1)
+    cart = ShoppingCart()
+
+    report = cart.add_products([(phone, 2), (case, 3), (case, 0), (case, 1), (phone, 4)])
+
+    assert [line.added for line in report] == [True, False, False, True, True]
+    assert report[1].error == "Product Case has only 1 items"
+    assert report[2].error == "Amount must be a positive integer"
+    assert cart.products == {phone: 4, case: 1}
+    assert cart.calculate_total() == 2020.0
+
+
+def test_remove_products_in_bulk():
+    """Масове видалення прибирає лише наявні рядки та оновлює суму."""
+    products = [Product(name=f"Product_{i}", price=1.5, available_amount=10) for i in range(1000)]
+    cart = ShoppingCart()
+    cart.add_products((product, 2) for product in products)
+
+    removed = cart.remove_products(products[:600] + [Product(name="Missing", price=1.0, available_amount=1)])
+
+    assert removed == 600
+    assert len(cart.products) == 400
+    assert cart.calculate_total() == 1200.0
+
+
+def test_importing_eshop_does_not_load_boto3():
+    """Кошик і товари імпортуються без boto3 — сервіси доставки завантажуються лише при використанні."""
+    code = "import sys, app.eshop, services; assert 'boto3' not in sys.modules; services.ShippingService; " \
+           "assert 'boto3' in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_add_products_checks_stock_in_one_batch(mocker):
+    """Залишки всіх рядків перевіряються одним пакетним викликом рушія складу."""
+    check_available = mocker.spy(inventory, "check_available")
+    products = [Product(name=f"Batch_{i}", price=1.0, available_amount=i) for i in range(50)]
+    cart = ShoppingCart()
+
+    report = cart.add_products((product, 10) for product in products)
+
+    check_available.assert_called_once()
+    assert [line.added for line in report] == [i >= 10 for i in range(50)]
+    assert report[3].error == "Product Batch_3 has only 3 items"
+    assert len(cart.products) == 40
+
+
+def test_total_follows_price_changes(mocker):
+    """Сума кошика враховує зміну ціни товару без ручного update_price і перераховує лише його рядок."""
+    phone = Product(name="PricedPhone", price=100.0, available_amount=5)
+    case = Product(name="PricedCase", price=10.0, available_amount=5)
+    cart = ShoppingCart()
+    cart.add_products([(phone, 2), (case, 1)])
+    assert cart.calculate_total() == 210.0
+    update_price = mocker.spy(cart, "update_price")
+
+    phone.price = 90.0
+    assert cart.calculate_total() == 190.0
+    assert update_price.call_count == 1
+
+    Product(name="Unrelated", price=1.0, available_amount=1).price = 2.0
+    assert cart.calculate_total() == 190.0
+    assert update_price.call_count == 1
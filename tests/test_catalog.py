@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+from app.catalog import Catalog, ProductView
+from app.eshop import Product, ShoppingCart
+
+
+def test_catalog_views_work_with_cart():
+    """Товари каталогу можна додавати до кошика разом зі звичайними Product."""
+    catalog = Catalog.from_columns(["Phone", "Laptop"], [500.0, 1500.0], [10, 2])
+    cart = ShoppingCart()
+
+    cart.add_product(catalog["Phone"], 3)
+    cart.add_product(Product(name="Case", price=20.0, available_amount=5), 1)
+
+    assert cart.contains_product(Product(name="Phone", price=500.0, available_amount=1))
+    assert cart.calculate_total() == 1520.0
+
+    cart.submit_cart_order()
+    assert catalog["Phone"].available_amount == 7
+    assert not hasattr(catalog["Phone"], "__dict__")
+
+
+def test_catalog_bulk_operations():
+    """Масове поповнення та зміна цін оновлюють колонки каталогу."""
+    catalog = Catalog()
+    for i in range(100):
+        catalog.add(f"Product_{i}", 10.0, i)
+
+    catalog.restock({"Product_0": 5, "Product_99": 1})
+    catalog.reprice({"Product_1": 12.5})
+    catalog.reprice_all(2)
+
+    assert catalog["Product_0"].available_amount == 5
+    assert catalog["Product_99"].available_amount == 100
+    assert catalog["Product_1"].price == 25.0
+    assert catalog["Product_2"].price == 20.0
+    assert isinstance(catalog.get("Product_3"), ProductView)
+    assert catalog.get("Missing") is None
+
+
+def test_catalog_rejects_invalid_products():
+    """Каталог перевіряє товари так само, як Product."""
+    catalog = Catalog()
+    catalog.add("Phone", 500.0, 1)
+
+    with pytest.raises(ValueError):
+        catalog.add("Phone", 500.0, 1)
+    with pytest.raises(ValueError):
+        catalog.add("Broken", -1, 1)
+    with pytest.raises(ValueError):
+        catalog.restock({"Phone": -1})
+
+
+def test_price_many_carts_with_catalog_prices():
+    """Пакетний розрахунок сум кошиків за цінами каталогу з округленням до копійки."""
+    catalog = Catalog.from_columns(["Pen", "Book"], [0.1, 12.345], [100, 100])
+    first, second = ShoppingCart(), ShoppingCart()
+    first.add_product(catalog["Pen"], 3)
+    second.add_product(catalog["Book"], 1)
+    second.add_product(Product(name="Bag", price=5.0, available_amount=1), 1)
+
+    catalog.reprice({"Book": 10.005})
+
+    assert catalog.price_carts([first, second]) == [0.3, 15.01]
+
+
+def test_cart_total_is_kept_up_to_date():
+    """Сума кошика оновлюється при заміні, видаленні та зміні ціни товару."""
+    catalog = Catalog.from_columns(["Pen", "Book"], [0.1, 12.5], [100, 100])
+    cart = ShoppingCart()
+
+    cart.add_product(catalog["Pen"], 3)
+    cart.add_product(catalog["Book"], 2)
+    assert cart.calculate_total() == 25.3
+
+    cart.add_product(catalog["Book"], 1)
+    assert cart.calculate_total() == 12.8
+
+    catalog.reprice({"Pen": 0.2})
+    cart.update_price(catalog["Pen"])
+    assert cart.calculate_total() == 13.1
+
+    cart.remove_product(catalog["Book"])
+    assert cart.calculate_total() == 0.6
+
+    catalog.reprice_all(2)
+    assert cart.calculate_total() == 1.2
+
+
+def test_catalog_packs_names_into_one_buffer():
+    """Назви зберігаються в одному буфері UTF-8, а пошук іде через хеш-таблицю в масиві."""
+    names = [f"Товар {i}" for i in range(1000)] + ["Phone", "Чохол"]
+    catalog = Catalog.from_columns(names, [1.0] * len(names), [1] * len(names))
+
+    assert [product.name for product in catalog] == names
+    assert catalog.index_of("Чохол") == len(names) - 1
+    assert "Товар 999" in catalog
+    assert "Товар 1000" not in catalog and 5 not in catalog
+    with pytest.raises(KeyError):
+        catalog["Товар"]
+    assert not any(isinstance(value, (list, dict)) for value in vars(catalog).values())
+
+
+def test_restock_and_buys_do_not_lose_updates():
+    """Поповнення каталогу йде під локами рушія і не губить паралельні покупки."""
+    catalog = Catalog.from_columns(["Hot"], [1.0], [5000])
+
+    def buyer():
+        for _ in range(1000):
+            catalog["Hot"].buy(1)
+
+    def restocker():
+        for _ in range(1000):
+            catalog.restock({"Hot": 1})
+
+    threads = [threading.Thread(target=target) for target in (buyer, buyer, restocker, restocker)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert catalog["Hot"].available_amount == 5000
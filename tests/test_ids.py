@@ -0,0 +1,53 @@
+import os
+from datetime import datetime, timezone
+
+from app.eshop import Order, ShoppingCart
+from app import ids
+from app.ids import UlidGenerator, set_order_id_generator, new_order_id, ulid_datetime
+
+
+def test_orders_get_unique_time_ordered_ids(mocker):
+    """Кожне замовлення отримує власний ID, і ID впорядковані за часом."""
+    ids = [Order(ShoppingCart(), mocker.Mock()).order_id for _ in range(1000)]
+
+    assert len(set(ids)) == 1000
+    assert ids == sorted(ids)
+    assert all(len(order_id) == 26 for order_id in ids)
+
+
+def test_ulid_encodes_creation_time():
+    """Мітка часу ULID відповідає годиннику генератора, а ID в межах мілісекунди монотонні."""
+    created = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    generator = UlidGenerator(clock=lambda: int(created.timestamp() * 1_000_000_000), seed=42)
+
+    first, second = generator(), generator()
+
+    assert ulid_datetime(first) == created
+    assert first < second
+
+
+def test_order_id_generator_is_pluggable():
+    """Генератор ID замовлень можна замінити."""
+    set_order_id_generator(lambda: "custom-id")
+    try:
+        assert new_order_id() == "custom-id"
+    finally:
+        set_order_id_generator(UlidGenerator())
+
+
+def test_only_current_generator_is_reseeded_after_fork(mocker):
+    """Генератори не реєструють власних fork-хуків; після fork заново ініціалізується лише поточний."""
+    register = mocker.spy(os, 'register_at_fork')
+    generator, other = UlidGenerator(seed=1), UlidGenerator(seed=2)
+    assert register.call_count == 0
+
+    reseed, other_reseed = mocker.spy(generator, '_reseed'), mocker.spy(other, '_reseed')
+    set_order_id_generator(generator)
+    try:
+        ids._reseed_after_fork()
+        set_order_id_generator(lambda: "custom-id")
+        ids._reseed_after_fork()
+    finally:
+        set_order_id_generator(UlidGenerator())
+    assert reseed.call_count == 1
+    assert other_reseed.call_count == 0
@@ -0,0 +1,116 @@
+import pytest
+
+from app.eshop import Order, Product, ShoppingCart
+from services import ShippingService
+from services import instrumentation
+from services.instrumentation import instrumented
+from services.publisher import ShippingPublisher
+from services.repository import ShippingRepository
+from services.testing import FakeShippingPublisher, FakeShippingRepository
+
+
+@pytest.fixture
+def metrics():
+    instrumentation.instrumentation.reset()
+    instrumentation.enable()
+    yield instrumentation.instrumentation
+    instrumentation.disable()
+    instrumentation.instrumentation.reset()
+    instrumentation.instrumentation.span_hooks.clear()
+
+
+class Source:
+
+    @instrumented('test')
+    def items(self, count):
+        yield from range(count)
+
+    @instrumented('test', batch_arg='ids')
+    def fail(self, ids):
+        raise ValueError(ids)
+
+
+def test_disabled_instrumentation_records_nothing(mocker):
+    """Вимкнена інструментація не збирає метрик."""
+    instrumentation.instrumentation.reset()
+    publisher = ShippingPublisher(client=mocker.MagicMock(), queue_url="http://queue")
+    publisher.poll_shipping(wait_time=0)
+
+    assert instrumentation.instrumentation.stats() == {}
+
+
+def test_publisher_metrics_and_prometheus_export(mocker, metrics):
+    """Виклики паблішера рахуються з розміром пакета, порожніми опитуваннями та помилками."""
+    client = mocker.MagicMock()
+    client.receive_message.return_value = {}
+    client.send_message_batch.return_value = {"Successful": [], "Failed": []}
+    publisher = ShippingPublisher(client=client, queue_url="http://queue")
+
+    publisher.poll_shipping(wait_time=0)
+    publisher.send_new_shippings([f"shipping_{i}" for i in range(12)])
+    assert list(Source().items(3)) == [0, 1, 2]
+    with pytest.raises(ValueError):
+        Source().fail(["a", "b"])
+
+    stats = metrics.stats()
+    assert stats["publisher.poll_shipping"]["empty"] == 1
+    assert stats["publisher.send_new_shippings"]["mean_batch_size"] == 12
+    assert stats["test.items"]["mean_batch_size"] == 3
+    assert stats["test.fail"]["errors"] == 1
+
+    text = instrumentation.render_prometheus()
+    assert '# TYPE shipping_operation_seconds histogram' in text
+    assert 'shipping_operation_calls_total{component="publisher",operation="poll_shipping"} 1' in text
+    assert 'shipping_empty_polls_total{component="publisher",operation="poll_shipping"} 1' in text
+    assert 'shipping_batch_size_bucket{component="publisher",operation="send_new_shippings",le="25"} 1' in text
+    assert 'shipping_operation_errors_total{component="test",operation="fail"} 1' in text
+
+
+def test_spans_follow_place_order(metrics):
+    """Спан сервісу доставки несе order_id і вкладається у спан, відкритий викликачем."""
+    spans = []
+    metrics.span_hooks.append(spans.append)
+    service = ShippingService(FakeShippingRepository(), FakeShippingPublisher())
+    cart = ShoppingCart()
+    cart.add_product(Product(name="Traced", price=10.0, available_amount=1), 1)
+
+    with instrumentation.span("request.checkout") as root:
+        Order(cart, service, "traced_order").place_order(service.list_available_shipping_type()[0])
+
+    by_name = {span.name: span for span in spans}
+    assert by_name["service.create_shipping"].attributes["order_id"] == "traced_order"
+    assert by_name["service.create_shipping"].parent is root
+    assert root.duration >= by_name["service.create_shipping"].duration
+
+
+def test_failing_hooks_do_not_fail_the_order(metrics):
+    """Хуки метрик і трейсів, що падають, не впливають на результат замовлення."""
+    def broken(*args):
+        raise RuntimeError("exporter is down")
+
+    metrics.span_hooks.append(broken)
+    metrics.hooks.append(broken)
+    service = ShippingService(FakeShippingRepository(), FakeShippingPublisher())
+    product = Product(name="Observed", price=10.0, available_amount=2)
+    cart = ShoppingCart()
+    cart.add_product(product, 1)
+    try:
+        shipping_id = Order(cart, service, "observed_order").place_order(service.list_available_shipping_type()[0])
+    finally:
+        metrics.hooks.remove(broken)
+
+    assert service.check_status(shipping_id) == service.SHIPPING_IN_PROGRESS
+    assert product.available_amount == 1
+    assert metrics.stats()["service.create_shipping"]["calls"] == 1
+
+
+def test_overdue_query_is_recorded_once(mocker, metrics):
+    """Запит прострочених доставок рахується один раз — у query_by_status."""
+    repository = ShippingRepository(dynamo_resource=mocker.MagicMock())
+    mocker.patch.object(repository, "_paginate", return_value=iter([]))
+
+    list(repository.query_overdue("in progress"))
+
+    stats = metrics.stats()
+    assert "repository.query_overdue" not in stats
+    assert stats["repository.query_by_status"]["calls"] == 1
@@ -1,5 +1,11 @@
+import asyncio
+import csv
+import json
+import threading
+import time
 import uuid
 import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 import boto3
@@ -7,9 +13,19 @@ import pytest
 
 from app.eshop import Product, ShoppingCart, Order, Shipment
 from services import ShippingService
+from services.async_service import AsyncShippingService
+from services.cache import CachingShippingRepository
+from services.clients import get_client, get_dynamodb_resource, get_queue_url
+from services.consumer import ShippingConsumer
+from services.export import export_shippings
+from services.migrate import migrate_shippings
+from services.outbox import OutboxRelay
+from services.sweeper import OverdueShippingSweeper
 from services.repository import ShippingRepository
-from services.publisher import ShippingPublisher
-from services.config import AWS_ENDPOINT_URL, AWS_REGION, SHIPPING_QUEUE
+from services.resilience import CircuitOpenError
+from services.publisher import ShippingPublisher, ShippingMessage, shard_queue_names
+from services.config import AWS_ENDPOINT_URL, AWS_REGION
+from services.testing import FakeShippingRepository, FakeShippingPublisher
 
 
 @pytest.mark.parametrize("order_id, shipping_id", [
@@ -49,7 +65,7 @@ def test_place_order_with_mocked_repo(mocker, order_id, shipping_id):
         shipping_service.SHIPPING_CREATED,
         due_date
     )
-    mock_publisher.send_new_shipping.assert_called_with(shipping_id)
+    mock_publisher.send_new_shipping.assert_called_with(shipping_id, order_id)
 
 
 def test_place_order_with_unavailable_shipping_type_fails(dynamo_resource):
@@ -97,7 +113,8 @@ def test_when_place_order_then_shipping_in_queue(dynamo_resource):
         aws_access_key_id="test",
         aws_secret_access_key="test"
     )
-    queue_url = sqs_client.get_queue_url(QueueName=SHIPPING_QUEUE)["QueueUrl"]
+    # the shard (and the .fifo suffix) depend on the queue configuration
+    queue_url = shipping_service.publisher.queue_for(shipping_id, order.order_id)
     response = sqs_client.receive_message(
         QueueUrl=queue_url,
         MaxNumberOfMessages=1,
@@ -238,3 +255,668 @@ def test_create_shipping_without_due_date(dynamo_resource):
     order = Order(cart, service)
     shipping_id = order.place_order(service.list_available_shipping_type()[0])
     assert shipping_id is not None
+
+
+def test_create_shippings_reports_partial_failures(mocker):
+    """Пакетне створення доставок повертає результат для кожного замовлення."""
+    mock_repo = mocker.Mock()
+    mock_publisher = mocker.Mock()
+    service = ShippingService(mock_repo, mock_publisher)
+
+    mock_repo.create_shippings.return_value = ["shipping_1", "shipping_2"]
+    mock_publisher.send_new_shippings.return_value = ({"shipping_1": "message_1"}, {"shipping_2": "Throttled"})
+
+    due_date = datetime.now(timezone.utc) + timedelta(minutes=5)
+    shipping_type = service.list_available_shipping_type()[0]
+    results = service.create_shippings([
+        {"shipping_type": shipping_type, "product_ids": ["A"], "order_id": "order_1", "due_date": due_date},
+        {"shipping_type": "Невідомий", "product_ids": ["B"], "order_id": "order_2", "due_date": due_date},
+        {"shipping_type": shipping_type, "product_ids": ["C"], "order_id": "order_3", "due_date": due_date},
+    ])
+
+    assert [r["shipping_id"] for r in results] == ["shipping_1", None, "shipping_2"]
+    assert results[0]["error"] is None
+    assert results[1]["error"] == "Shipping type is not available"
+    assert results[2]["error"] == "Throttled"
+    mock_repo.create_shippings.assert_called_once()
+    assert mock_repo.create_shippings.call_args.args[1] == service.SHIPPING_IN_PROGRESS
+    mock_repo.update_shipping_status.assert_called_once_with("shipping_2", service.SHIPPING_CREATED)
+
+
+def test_create_shippings_reports_malformed_records(mocker):
+    """Запис без потрібних полів або з зайвими отримує власну помилку, а решта пакета створюється."""
+    mock_repo = mocker.Mock()
+    mock_publisher = mocker.Mock()
+    service = ShippingService(mock_repo, mock_publisher)
+
+    mock_repo.create_shippings.return_value = ["shipping_1"]
+    mock_publisher.send_new_shippings.return_value = ({"shipping_1": "message_1"}, {})
+
+    due_date = datetime.now(timezone.utc) + timedelta(minutes=5)
+    shipping_type = service.list_available_shipping_type()[0]
+    results = service.create_shippings([
+        {"shipping_type": shipping_type, "order_id": "order_1", "due_date": due_date},
+        {"shipping_type": shipping_type, "product_ids": ["B"], "order_id": "order_2", "due_date": due_date},
+        {"shipping_type": shipping_type, "product_ids": ["C"], "order_id": "order_3", "due_date": due_date,
+         "priority": 1},
+        {"shipping_type": shipping_type, "product_ids": ["D"], "due_date": due_date},
+    ])
+
+    assert [r["shipping_id"] for r in results] == [None, "shipping_1", None, None]
+    assert results[0]["error"] == "Shipping product ids are required"
+    assert results[1]["error"] is None
+    assert results[2]["error"] == "Unknown shipping fields: priority"
+    assert results[3]["error"] == "Shipping order id is required"
+    assert len(mock_repo.create_shippings.call_args.args[0]) == 1
+
+
+def test_create_shippings_reports_publish_errors(mocker):
+    """Збій публікації не виходить за межі пакета: записи повертаються в created з помилкою."""
+    mock_repo = mocker.Mock()
+    mock_publisher = mocker.Mock()
+    service = ShippingService(mock_repo, mock_publisher)
+
+    mock_repo.create_shippings.return_value = ["shipping_1", "shipping_2"]
+    mock_publisher.send_new_shippings.side_effect = CircuitOpenError("Circuit for ShippingQueue is open")
+
+    due_date = datetime.now(timezone.utc) + timedelta(minutes=5)
+    shipping_type = service.list_available_shipping_type()[0]
+    results = service.create_shippings([
+        {"shipping_type": shipping_type, "product_ids": ["A"], "order_id": "order_1", "due_date": due_date},
+        {"shipping_type": shipping_type, "product_ids": ["B"], "order_id": "order_2"},
+        {"shipping_type": shipping_type, "product_ids": ["C"], "order_id": "order_3", "due_date": due_date},
+    ])
+
+    assert [r["shipping_id"] for r in results] == ["shipping_1", None, "shipping_2"]
+    assert results[1]["error"] == "Shipping due datetime is required"
+    assert results[0]["error"] == results[2]["error"] == "Circuit for ShippingQueue is open"
+    assert mock_repo.update_shipping_status.call_args_list == [
+        mocker.call("shipping_1", service.SHIPPING_CREATED),
+        mocker.call("shipping_2", service.SHIPPING_CREATED),
+    ]
+
+
+def test_create_shippings_in_batch(dynamo_resource):
+    """Пакетне створення доставок записує їх одразу у статусі 'in progress'."""
+    service = ShippingService(ShippingRepository(), ShippingPublisher())
+    due_date = datetime.now(timezone.utc) + timedelta(minutes=5)
+    batch = [
+        {
+            "shipping_type": service.list_available_shipping_type()[1],
+            "product_ids": [f"Product_{i}"],
+            "order_id": f"order_{i}",
+            "due_date": due_date,
+        }
+        for i in range(30)
+    ]
+
+    results = service.create_shippings(batch)
+
+    assert len(results) == 30
+    assert all(result["error"] is None for result in results)
+    assert len({result["shipping_id"] for result in results}) == 30
+    assert service.check_status(results[-1]["shipping_id"]) == service.SHIPPING_IN_PROGRESS
+
+
+def test_consumer_processes_messages_with_bounded_in_flight(mocker):
+    """Консюмер обробляє всі отримані повідомлення, не перевищуючи ліміт in-flight."""
+    mock_repo = mocker.Mock()
+    mock_publisher = mocker.Mock()
+    service = ShippingService(mock_repo, mock_publisher)
+    mock_repo.transition_status.return_value = ShippingService.SHIPPING_COMPLETED
+
+    visible_until = time.monotonic() + 60
+    pending = [ShippingMessage(f"shipping_{i}", f"handle_{i}", visible_until) for i in range(25)]
+    requested = []
+
+    def poll_shipping(batch_size, wait_time):
+        requested.append(batch_size)
+        batch, pending[:] = pending[:batch_size], pending[batch_size:]
+        if not batch:
+            time.sleep(0.01)
+        return batch
+
+    mock_publisher.poll_shipping.side_effect = poll_shipping
+
+    consumer = ShippingConsumer(service, pollers=2, workers=3, max_in_flight=4, wait_time=0)
+    with consumer:
+        deadline = time.monotonic() + 10
+        while consumer.processed + consumer.errors < 25 and time.monotonic() < deadline:
+            assert consumer.in_flight <= 4
+            time.sleep(0.001)
+
+    assert consumer.errors == 0
+    assert consumer.in_flight == 0
+    assert max(requested) <= 4
+    assert mock_repo.transition_status.call_count == 25
+    acknowledged = [m for call in mock_publisher.acknowledge.call_args_list for m in call.args[0]]
+    assert sorted(m.receipt_handle for m in acknowledged) == sorted(f"handle_{i}" for i in range(25))
+
+
+def test_process_batch_acknowledges_and_extends_messages(mocker):
+    """Оброблені повідомлення видаляються з черги, а повільні отримують продовження видимості."""
+    mock_repo = mocker.Mock()
+    mock_publisher = mocker.Mock()
+    mock_publisher.visibility_timeout = 30
+    service = ShippingService(mock_repo, mock_publisher)
+    mock_repo.transition_status.return_value = ShippingService.SHIPPING_COMPLETED
+
+    fresh = ShippingMessage("shipping_1", "handle_1", time.monotonic() + 30)
+    stale = ShippingMessage("shipping_2", "handle_2", time.monotonic() + 5)
+    mock_publisher.poll_shipping.return_value = [fresh, stale]
+
+    def extend_visibility(messages):
+        for message in messages:
+            message.visible_until = time.monotonic() + 30
+        return []
+
+    mock_publisher.extend_visibility.side_effect = extend_visibility
+
+    result = service.process_shipping_batch()
+
+    assert len(result) == 2
+    mock_publisher.extend_visibility.assert_called_once_with([stale])
+    mock_publisher.acknowledge.assert_called_once_with([fresh, stale])
+
+
+def test_publisher_acknowledges_polled_messages(dynamo_resource):
+    """Отримані повідомлення можна продовжити та видалити з черги."""
+    publisher = ShippingPublisher()
+    publisher.send_new_shipping(str(uuid.uuid4()))
+
+    messages = publisher.poll_shipping(wait_time=1)
+
+    assert messages
+    assert publisher.extend_visibility(messages) == []
+    assert publisher.acknowledge(messages) == []
+
+
+def test_process_shipping_transitions_status_once(dynamo_resource):
+    """Обробка доставки змінює статус одним умовним записом і не повторюється."""
+    repository = ShippingRepository()
+    service = ShippingService(repository, ShippingPublisher())
+    shipping_type = service.list_available_shipping_type()[0]
+
+    on_time_id = repository.create_shipping(
+        shipping_type, ["Product"], "order_1", service.SHIPPING_IN_PROGRESS,
+        datetime.now(timezone.utc) + timedelta(minutes=5)
+    )
+    overdue_id = repository.create_shipping(
+        shipping_type, ["Product"], "order_2", service.SHIPPING_IN_PROGRESS,
+        datetime.now(timezone.utc) - timedelta(minutes=5)
+    )
+
+    assert service.process_shipping(on_time_id) == service.SHIPPING_COMPLETED
+    assert service.process_shipping(overdue_id) == service.SHIPPING_FAILED
+    assert service.process_shipping(on_time_id) is None
+    assert service.process_shipping(str(uuid.uuid4())) is None
+    assert service.check_status(on_time_id) == service.SHIPPING_COMPLETED
+    assert service.check_status(overdue_id) == service.SHIPPING_FAILED
+
+
+def test_check_shipping_statuses_in_bulk(dynamo_resource):
+    """Статуси багатьох доставок отримуються пакетними запитами."""
+    service = ShippingService(ShippingRepository(), ShippingPublisher())
+    due_date = datetime.now(timezone.utc) + timedelta(minutes=5)
+    results = service.create_shippings([
+        {
+            "shipping_type": service.list_available_shipping_type()[2],
+            "product_ids": ["Product"],
+            "order_id": f"order_{i}",
+            "due_date": due_date,
+        }
+        for i in range(120)
+    ])
+    shipments = [Shipment(result["shipping_id"], service) for result in results]
+    shipments.append(Shipment("unknown_shipping", service))
+
+    statuses = Shipment.check_shipping_statuses(shipments)
+
+    assert len(statuses) == 121
+    assert statuses["unknown_shipping"] is None
+    assert all(statuses[result["shipping_id"]] == service.SHIPPING_IN_PROGRESS for result in results)
+
+
+def test_cached_repository_serves_reads_and_tracks_writes(mocker):
+    """Кеш повертає збережені доставки, оновлюється при записі та рахує звернення."""
+    now = [0.0]
+    mock_repo = mocker.Mock()
+    mock_repo.get_shipping.return_value = {"shipping_id": "shipping_1", "shipping_status": "in progress"}
+    mock_repo.transition_status.return_value = ShippingService.SHIPPING_COMPLETED
+    repository = CachingShippingRepository(mock_repo, max_size=1, ttl=5, terminal_ttl=300, clock=lambda: now[0])
+    service = ShippingService(repository, mocker.Mock())
+
+    assert service.check_status("shipping_1") == service.SHIPPING_IN_PROGRESS
+    assert service.check_status("shipping_1") == service.SHIPPING_IN_PROGRESS
+    assert mock_repo.get_shipping.call_count == 1
+
+    service.process_shipping("shipping_1")
+    now[0] = 100
+    assert service.check_status("shipping_1") == service.SHIPPING_COMPLETED
+    assert mock_repo.get_shipping.call_count == 1
+
+    mock_repo.get_shipping.return_value = {"shipping_id": "shipping_2", "shipping_status": "in progress"}
+    service.check_status("shipping_2")
+    assert repository.stats() == {"hits": 2, "misses": 2, "evictions": 1, "expirations": 0, "size": 1}
+
+
+def test_cached_repository_follows_sweeper_and_remembers_misses(mocker):
+    """Кеш бачить доставки, провалені sweeper-ом, і недовго пам'ятає невідомі ID."""
+    now = [0.0]
+    mock_repo = mocker.Mock()
+    mock_repo.get_shipping.return_value = {"shipping_id": "shipping_1", "shipping_status": "in progress"}
+    mock_repo.fail_overdue.return_value = True
+    mock_repo.get_shipping_statuses.return_value = {}
+    repository = CachingShippingRepository(mock_repo, ttl=5, miss_ttl=1, clock=lambda: now[0])
+    service = ShippingService(repository, mocker.Mock())
+
+    assert service.check_status("shipping_1") == service.SHIPPING_IN_PROGRESS
+    assert service.fail_overdue_shipping("shipping_1")
+    assert service.check_status("shipping_1") == service.SHIPPING_FAILED
+    assert mock_repo.get_shipping.call_count == 1
+
+    for _ in range(3):
+        assert repository.get_shipping_statuses(["unknown"]) == {}
+    assert mock_repo.get_shipping_statuses.call_count == 1
+    now[0] = 2
+    repository.get_shipping_statuses(["unknown"])
+    assert mock_repo.get_shipping_statuses.call_count == 2
+
+
+def test_services_share_pooled_clients(mocker):
+    """Репозиторії та паблішери використовують спільні клієнти та кешований URL черги."""
+    assert ShippingRepository().dynamo_resource is ShippingRepository().dynamo_resource
+    assert ShippingPublisher().client is ShippingPublisher().client
+
+    sqs_client = mocker.MagicMock()
+    service = ShippingService.from_clients(sqs_client=sqs_client, queue_url="http://queue")
+    service.publisher.send_new_shipping("shipping_1")
+
+    sqs_client.get_queue_url.assert_not_called()
+    sqs_client.send_message.assert_called_once_with(QueueUrl="http://queue", MessageBody="shipping_1")
+
+
+def test_threads_get_own_resources_over_shared_client(mocker):
+    """Кожен потік має власний ресурс DynamoDB, але всі вони працюють через один клієнт."""
+    repository = ShippingRepository()
+    resources = {}
+
+    def worker():
+        resources["worker"] = (get_dynamodb_resource(), repository.table)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+
+    assert resources["worker"][0] is not get_dynamodb_resource()
+    assert resources["worker"][1] is not repository.table
+    assert resources["worker"][0].meta.client is get_dynamodb_resource().meta.client is get_client("dynamodb")
+
+    other_endpoint = mocker.MagicMock()
+    other_endpoint.meta.endpoint_url = "http://other-endpoint"
+    other_endpoint.get_queue_url.return_value = {"QueueUrl": "http://other-endpoint/queue"}
+    assert get_queue_url(shard_queue_names()[0], other_endpoint) == "http://other-endpoint/queue"
+    assert get_queue_url(shard_queue_names()[0]) != "http://other-endpoint/queue"
+
+
+def test_async_service_processes_batch_concurrently(mocker):
+    """Асинхронний сервіс обробляє повідомлення партії паралельно та підтверджує успішні."""
+    mock_repo = mocker.Mock()
+    mock_publisher = mocker.Mock()
+    mock_publisher.visibility_timeout = 30
+    messages = [ShippingMessage(f"shipping_{i}", f"handle_{i}", time.monotonic() + 30) for i in range(10)]
+    mock_publisher.poll_shipping.return_value = messages
+
+    def transition_status(shipping_id, *args):
+        time.sleep(0.2)
+        return ShippingService.SHIPPING_COMPLETED
+
+    mock_repo.transition_status.side_effect = transition_status
+
+    async def run():
+        async with AsyncShippingService(mock_repo, mock_publisher, max_workers=10) as service:
+            started = time.monotonic()
+            results = await service.process_shipping_batch()
+            return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(run())
+
+    assert results == [ShippingService.SHIPPING_COMPLETED] * 10
+    assert elapsed < 1
+    mock_publisher.acknowledge.assert_called_once_with(messages)
+
+
+def test_async_service_creates_and_checks_shipping(dynamo_resource):
+    """Асинхронне створення доставки та перевірка її статусу."""
+    async def run():
+        async with AsyncShippingService(ShippingRepository(), ShippingPublisher()) as service:
+            due_date = datetime.now(timezone.utc) + timedelta(minutes=5)
+            shipping_ids = await asyncio.gather(*(
+                service.create_shipping(service.list_available_shipping_type()[0], ["Product"], f"order_{i}", due_date)
+                for i in range(20)
+            ))
+            return shipping_ids, await service.check_statuses(shipping_ids)
+
+    shipping_ids, statuses = asyncio.run(run())
+
+    assert len(set(shipping_ids)) == 20
+    assert set(statuses.values()) == {ShippingService.SHIPPING_IN_PROGRESS}
+
+
+def test_async_service_leaves_callers_executor_running():
+    """Асинхронний сервіс не зупиняє виконавця, переданого викликачем."""
+    async def run(executor):
+        async with AsyncShippingService(FakeShippingRepository(), FakeShippingPublisher(), executor=executor) as service:
+            return await service.check_statuses(["unknown"])
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        asyncio.run(run(executor))
+        assert executor.submit(lambda: "still running").result(timeout=1) == "still running"
+
+
+def test_shipping_pipeline_on_fakes():
+    """Повний цикл замовлення та обробки доставки на in-memory фейках."""
+    service = ShippingService(FakeShippingRepository(), FakeShippingPublisher())
+    cart = ShoppingCart()
+    cart.add_product(Product(available_amount=5, name="FakeProduct", price=10.0), amount=2)
+
+    shipping_id = Order(cart, service).place_order(service.list_available_shipping_type()[0])
+    assert service.check_status(shipping_id) == service.SHIPPING_IN_PROGRESS
+
+    assert service.process_shipping_batch() == [service.SHIPPING_COMPLETED]
+    assert service.check_status(shipping_id) == service.SHIPPING_COMPLETED
+    assert service.process_shipping_batch() == []
+    assert service.publisher.in_flight == {}
+
+
+def test_scan_and_migration_on_fakes():
+    """Фейковий репозиторій сканує сегменти з on_page, тож міграція працює й без LocalStack."""
+    repository = FakeShippingRepository()
+    due_date = datetime.now(timezone.utc) + timedelta(minutes=5)
+    repository.create_shippings([
+        {"shipping_type": "Нова Пошта", "product_ids": ["A"], "order_id": f"order_{i}", "due_date": due_date}
+        for i in range(5)
+    ], ShippingService.SHIPPING_IN_PROGRESS)
+    repository.items["legacy"] = {
+        "shipping_id": "legacy", "shipping_type": "Нова Пошта", "order_id": "legacy_order", "product_ids": "A,B",
+        "shipping_status": ShippingService.SHIPPING_IN_PROGRESS, "due_date": due_date.isoformat(),
+    }
+
+    pages = []
+    assert len(list(repository.scan_segment(0, 1, page_size=2, on_page=pages.append))) == 6
+    assert [page["Count"] for page in pages] == [2, 2, 2]
+
+    assert migrate_shippings(repository, segments=2) == {"migrated": 1, "skipped": 0}
+    assert repository.get_shipping("legacy")["product_ids"] == ["A", "B"]
+
+
+def test_place_order_through_outbox(dynamo_resource):
+    """Замовлення через outbox записується однією транзакцією, а relay публікує його в чергу."""
+    repository = ShippingRepository()
+    publisher = ShippingPublisher()
+    service = ShippingService(repository, publisher, use_outbox=True)
+    cart = ShoppingCart()
+    cart.add_product(Product(available_amount=5, name="OutboxProduct", price=10.0), amount=1)
+
+    shipping_id = Order(cart, service).place_order(service.list_available_shipping_type()[0])
+
+    assert service.check_status(shipping_id) == service.SHIPPING_IN_PROGRESS
+    assert shipping_id in repository.get_outbox_batch()
+
+    relay = OutboxRelay(repository, publisher)
+    assert relay.relay_once() >= 1
+    assert shipping_id not in repository.get_outbox_batch()
+
+
+def test_query_shippings_by_order_and_overdue(dynamo_resource):
+    """Пошук доставок замовлення та прострочених доставок через вторинні індекси."""
+    repository = ShippingRepository()
+    service = ShippingService(repository, ShippingPublisher())
+    shipping_type = service.list_available_shipping_type()[0]
+    order_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+
+    order_shipping_ids = {
+        repository.create_shipping(shipping_type, ["Product"], order_id, service.SHIPPING_IN_PROGRESS,
+                                   now + timedelta(minutes=i + 1))
+        for i in range(5)
+    }
+    overdue_id = repository.create_shipping(shipping_type, ["Product"], str(uuid.uuid4()),
+                                            service.SHIPPING_IN_PROGRESS, now - timedelta(minutes=1))
+
+    found = list(repository.query_by_order(order_id, page_size=2))
+    assert {item["shipping_id"] for item in found} == order_shipping_ids
+    assert len(service.list_order_shippings(order_id)) == 5
+
+    overdue = [item["shipping_id"] for item in service.list_overdue_shippings(now)]
+    assert overdue_id in overdue
+    assert not order_shipping_ids & set(overdue)
+
+    upcoming = [
+        item for item in repository.query_by_status(service.SHIPPING_IN_PROGRESS, due_after=now,
+                                                    due_before=now + timedelta(minutes=3))
+        if item["order_id"] == order_id
+    ]
+    assert len(upcoming) == 2
+
+
+def test_sweeper_fails_overdue_shippings_without_consumer():
+    """Прострочені доставки стають failed за дедлайном, навіть якщо черга не обробляється."""
+    repository = FakeShippingRepository()
+    service = ShippingService(repository, FakeShippingPublisher())
+    shipping_type = service.list_available_shipping_type()[0]
+    now = datetime.now(timezone.utc)
+    stale_id = repository.create_shipping(shipping_type, ["P"], "stale", service.SHIPPING_IN_PROGRESS,
+                                          now - timedelta(minutes=5))
+    later_id = service.create_shipping(shipping_type, ["P"], "later", now + timedelta(hours=1))
+
+    with OverdueShippingSweeper(service, refresh_interval=60) as sweeper:
+        soon_id = service.create_shipping(shipping_type, ["P"], "soon", datetime.now(timezone.utc) + timedelta(seconds=0.3))
+        deadline = time.monotonic() + 5
+        while service.check_status(soon_id) != service.SHIPPING_FAILED and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    assert service.check_status(stale_id) == service.SHIPPING_FAILED
+    assert service.check_status(soon_id) == service.SHIPPING_FAILED
+    assert service.check_status(later_id) == service.SHIPPING_IN_PROGRESS
+    assert sweeper.failed == 2
+    assert service.sweeper is None
+
+
+def test_typed_records_and_legacy_migration(dynamo_resource):
+    """Нові записи зберігають числові дати та список товарів, старі читаються й мігруються."""
+    repository = ShippingRepository()
+    service = ShippingService(repository, ShippingPublisher())
+    shipping_type = service.list_available_shipping_type()[0]
+    due_date = datetime.now(timezone.utc) + timedelta(minutes=5)
+
+    shipping_id = repository.create_shipping(shipping_type, ["Box, large", "Cup"], "typed_order",
+                                             service.SHIPPING_IN_PROGRESS, due_date)
+    shipping = repository.get_shipping(shipping_id)
+    assert shipping["product_ids"] == ["Box, large", "Cup"]
+    assert shipping["due_at"] == ShippingRepository.epoch_ms(due_date)
+    assert shipping["schema_version"] == ShippingRepository.SCHEMA_VERSION
+
+    legacy_ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+    for legacy_id in legacy_ids:
+        repository.table.put_item(Item={
+            "shipping_id": legacy_id,
+            "shipping_type": shipping_type,
+            "order_id": "legacy_order",
+            "product_ids": "A,B",
+            "shipping_status": service.SHIPPING_IN_PROGRESS,
+            "created_date": datetime.now(timezone.utc).isoformat(),
+            "due_date": due_date.isoformat(),
+        })
+
+    legacy = repository.get_shipping(legacy_ids[0])
+    assert legacy["product_ids"] == ["A", "B"]
+    assert legacy["due_at"] == ShippingRepository.epoch_ms(due_date)
+    assert service.process_shipping(legacy_ids[0]) == service.SHIPPING_COMPLETED
+
+    assert migrate_shippings(repository, segments=4)["migrated"] >= 2
+    stored = repository.table.get_item(Key={"shipping_id": legacy_ids[1]})["Item"]
+    assert stored["schema_version"] == ShippingRepository.SCHEMA_VERSION
+    assert stored["product_ids"] == ["A", "B"]
+    assert "due_date" not in stored
+    assert stored["shipping_status"] == service.SHIPPING_IN_PROGRESS
+    assert repository.get_shipping(legacy_ids[0])["shipping_status"] == service.SHIPPING_COMPLETED
+    assert migrate_shippings(repository, segments=4) == {"migrated": 0, "skipped": 0}
+
+
+def test_export_shippings_to_csv(dynamo_resource, tmp_path):
+    """Паралельний експорт усіх доставок у файл частинами."""
+    repository = ShippingRepository()
+    service = ShippingService(repository, ShippingPublisher())
+    due_date = datetime.now(timezone.utc) + timedelta(minutes=5)
+    shipping_ids = repository.create_shippings([
+        {"shipping_type": service.list_available_shipping_type()[0], "product_ids": ["Box, large", f"P{i}"],
+         "order_id": f"export_{i}", "due_date": due_date}
+        for i in range(30)
+    ], service.SHIPPING_IN_PROGRESS)
+
+    path = tmp_path / "shippings.csv"
+    result = export_shippings(str(path), repository, segments=4, page_size=7, chunk_size=10, file_format="csv")
+
+    with open(path, newline="", encoding="utf-8") as exported:
+        rows = {row["shipping_id"]: row for row in csv.DictReader(exported)}
+    assert result["items"] == len(rows)
+    assert set(shipping_ids) <= set(rows)
+    assert json.loads(rows[shipping_ids[0]]["product_ids"]) == ["Box, large", "P0"]
+    assert int(rows[shipping_ids[0]]["due_at"]) == ShippingRepository.epoch_ms(due_date)
+    assert not (tmp_path / "shippings.csv.part").exists()
+
+
+@pytest.mark.parametrize("fifo", [False, True])
+def test_sharded_queues_keep_orders_together(fifo):
+    """Повідомлення одного замовлення потрапляють в одну шарду, а споживач читає лише свої шарди."""
+    sqs_client = boto3.client("sqs", endpoint_url=AWS_ENDPOINT_URL, region_name=AWS_REGION,
+                              aws_access_key_id="test", aws_secret_access_key="test")
+    attributes = {"FifoQueue": "true"} if fifo else {}
+    queue_urls = [
+        sqs_client.create_queue(QueueName=name, Attributes=attributes)["QueueUrl"]
+        for name in shard_queue_names(f"ShardTest{uuid.uuid4().hex[:8]}", shards=3, fifo=fifo)
+    ]
+    try:
+        publisher = ShippingPublisher(queue_urls=queue_urls)
+        order_ids = {f"shipping_{i}": f"order_{i % 4}" for i in range(12)}
+        sent, failed = publisher.send_new_shippings(list(order_ids), order_ids)
+        assert len(sent) == 12 and not failed
+        publisher.send_new_shipping("shipping_extra", "order_0")
+
+        received = {}
+        for shard, queue_url in enumerate(queue_urls):
+            consumer = ShippingPublisher(queue_urls=queue_urls, shards=[shard])
+            messages = consumer.poll_shipping(batch_size=10, wait_time=0)
+            while messages:
+                assert {message.queue_url for message in messages} == {queue_url}
+                if fifo:
+                    assert all(message.group_id == order_ids.get(message.shipping_id, "order_0")
+                               for message in messages)
+                for message in messages:
+                    received[message.shipping_id] = shard
+                assert consumer.acknowledge(messages) == []
+                messages = consumer.poll_shipping(batch_size=10, wait_time=0)
+
+        order_ids["shipping_extra"] = "order_0"
+        shards_by_order = {}
+        for shipping_id, shard in received.items():
+            shards_by_order.setdefault(order_ids[shipping_id], set()).add(shard)
+        assert all(len(shards) == 1 for shards in shards_by_order.values())
+        assert set(received) == set(order_ids)
+    finally:
+        for queue_url in queue_urls:
+            sqs_client.delete_queue(QueueUrl=queue_url)
+
+
+def test_place_order_with_numeric_order_id(dynamo_resource):
+    """Числовий order_id, який приймає Order, зберігається рядком ключа індексу й не ламає публікацію в чергу."""
+    publisher = ShippingPublisher()
+    service = ShippingService(ShippingRepository(), publisher)
+    cart = ShoppingCart()
+    cart.add_product(Product(available_amount=3, name="NumericOrder", price=10.0), amount=1)
+
+    shipping_id = Order(cart, service, 8662354).place_order(
+        service.list_available_shipping_type()[0],
+        datetime.now(timezone.utc) + timedelta(minutes=1)
+    )
+
+    assert service.check_status(shipping_id) == service.SHIPPING_IN_PROGRESS
+    assert [item["order_id"] for item in service.list_order_shippings(8662354)] == ["8662354"]
+    shard = publisher.queue_urls.index(publisher.queue_for(shipping_id, 8662354))
+    consumer = ShippingPublisher(shards=[shard])
+    received = set()
+    messages = consumer.poll_shipping(wait_time=0)
+    while messages and shipping_id not in received:
+        received.update(message.shipping_id for message in messages)
+        consumer.acknowledge(messages)
+        messages = consumer.poll_shipping(wait_time=0)
+    assert shipping_id in received
+
+
+def fifo_messages():
+    visible_until = time.monotonic() + 60
+    return [
+        ShippingMessage(shipping_id, f"handle_{shipping_id}", visible_until, group_id=shipping_id.split("_")[0])
+        for shipping_id in ["a_1", "b_1", "a_2", "a_3", "b_2"]
+    ]
+
+
+def ordered_transitions(mock_repo):
+    # the first message of a group is the slowest, so concurrent processing would reorder the group
+    finished = []
+    lock = threading.Lock()
+
+    def transition_status(shipping_id, *args):
+        time.sleep(0.05 if shipping_id.endswith("_1") else 0.001)
+        with lock:
+            finished.append(shipping_id)
+        return ShippingService.SHIPPING_COMPLETED
+
+    mock_repo.transition_status.side_effect = transition_status
+    return finished
+
+
+def test_consumer_keeps_fifo_group_order(mocker):
+    """Повідомлення однієї FIFO-групи з одного отримання обробляються по черзі."""
+    mock_repo = mocker.Mock()
+    mock_publisher = mocker.Mock()
+    mock_publisher.visibility_timeout = 60
+    finished = ordered_transitions(mock_repo)
+    pending = fifo_messages()
+
+    def poll_shipping(batch_size, wait_time):
+        batch, pending[:] = pending[:batch_size], pending[batch_size:]
+        if not batch:
+            time.sleep(0.01)
+        return batch
+
+    mock_publisher.poll_shipping.side_effect = poll_shipping
+    consumer = ShippingConsumer(ShippingService(mock_repo, mock_publisher), pollers=1, workers=4, wait_time=0)
+    with consumer:
+        deadline = time.monotonic() + 5
+        while consumer.processed < 5 and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    assert [shipping_id for shipping_id in finished if shipping_id.startswith("a")] == ["a_1", "a_2", "a_3"]
+    assert [shipping_id for shipping_id in finished if shipping_id.startswith("b")] == ["b_1", "b_2"]
+    assert consumer.in_flight == 0
+
+
+def test_async_service_keeps_fifo_group_order(mocker):
+    """Асинхронний сервіс паралелить різні групи, але не повідомлення однієї групи."""
+    mock_repo = mocker.Mock()
+    mock_publisher = mocker.Mock()
+    mock_publisher.visibility_timeout = 60
+    finished = ordered_transitions(mock_repo)
+    messages = fifo_messages()
+    mock_publisher.poll_shipping.return_value = messages
+
+    async def run():
+        async with AsyncShippingService(mock_repo, mock_publisher, max_workers=5) as service:
+            return await service.process_shipping_batch()
+
+    assert asyncio.run(run()) == [ShippingService.SHIPPING_COMPLETED] * 5
+    assert [shipping_id for shipping_id in finished if shipping_id.startswith("a")] == ["a_1", "a_2", "a_3"]
+    assert [shipping_id for shipping_id in finished if shipping_id.startswith("b")] == ["b_1", "b_2"]
+    mock_publisher.acknowledge.assert_called_once_with(messages)
@@ -0,0 +1,149 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.eshop import Product, ShoppingCart, Order
+from app.inventory import InventoryEngine, inventory
+from services import ShippingService
+
+
+def test_parallel_buys_do_not_oversell():
+    """Паралельні покупки не списують більше, ніж є на складі."""
+    product = Product(name="Hot", price=10.0, available_amount=100)
+    sold = []
+
+    def buyer():
+        for _ in range(50):
+            try:
+                product.buy(1)
+                sold.append(1)
+            except ValueError:
+                pass
+
+    threads = [threading.Thread(target=buyer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(sold) == 100
+    assert product.available_amount == 0
+
+
+def test_reservation_is_all_or_nothing():
+    """Резерв кількох товарів або проходить повністю, або не змінює залишків."""
+    engine = InventoryEngine(stripes=4)
+    phone = Product(name="Phone", price=500.0, available_amount=2)
+    case = Product(name="Case", price=20.0, available_amount=1)
+
+    with pytest.raises(ValueError):
+        engine.reserve({phone: 1, case: 2})
+    assert (phone.available_amount, case.available_amount) == (2, 1)
+
+    reservation = engine.reserve({phone: 2, case: 1})
+    assert (phone.available_amount, case.available_amount) == (0, 0)
+    assert engine.release(reservation)
+    assert (phone.available_amount, case.available_amount) == (2, 1)
+
+
+def test_expired_reservation_returns_stock():
+    """Прострочений резерв повертає товари на склад, а пізній commit списує їх знову, якщо вони ще є."""
+    now = [0.0]
+    engine = InventoryEngine(hold_ttl=10, clock=lambda: now[0])
+    tablet = Product(name="Tablet", price=300.0, available_amount=3)
+    phone = Product(name="Phone", price=500.0, available_amount=2)
+
+    reservation = engine.reserve({tablet: 3})
+    sold_out = engine.reserve({phone: 2})
+    now[0] = 11
+    assert engine.expire_holds() == 2
+    assert (tablet.available_amount, phone.available_amount) == (3, 2)
+
+    engine.commit(reservation)
+    assert tablet.available_amount == 0
+    with pytest.raises(ValueError):
+        engine.commit(reservation)
+
+    engine.buy(phone, 1)
+    with pytest.raises(ValueError):
+        engine.commit(sold_out)
+    assert phone.available_amount == 1
+
+
+def test_commit_racing_expiry_sees_returned_stock(monkeypatch):
+    """Commit, що збігся з простроченням резерву, не падає через ще не повернені товари."""
+    now = [0.0]
+    engine = InventoryEngine(hold_ttl=10, clock=lambda: now[0])
+    product = Product(name="Racing", price=1.0, available_amount=1)
+    reservation = engine.reserve({product: 1})
+    now[0] = 11
+
+    acquire = engine._acquire
+    racing = [reservation]
+
+    def commit_first(products):
+        # commit проскакує між вибором простроченого резерву та поверненням його товарів
+        if racing:
+            engine.commit(racing.pop())
+        return acquire(products)
+
+    monkeypatch.setattr(engine, "_acquire", commit_first)
+    assert engine.expire_holds() == 0
+    assert reservation.state == "committed"
+    assert product.available_amount == 0
+
+
+def test_failed_shipping_releases_reserved_stock(mocker):
+    """Якщо доставку не вдалося створити, товари повертаються на склад."""
+    mock_repo = mocker.Mock()
+    mock_repo.create_shipping.side_effect = RuntimeError("DynamoDB is unavailable")
+    service = ShippingService(mock_repo, mocker.Mock())
+    product = Product(name="Camera", price=700.0, available_amount=4)
+    cart = ShoppingCart()
+    cart.add_product(product, 3)
+
+    with pytest.raises(RuntimeError):
+        Order(cart, service).place_order(
+            service.list_available_shipping_type()[0],
+            datetime.now(timezone.utc) + timedelta(minutes=5)
+        )
+
+    assert product.available_amount == 4
+    assert cart.contains_product(product)
+
+
+def test_order_survives_hold_expiring_during_shipping(mocker, monkeypatch):
+    """Якщо резерв прострочився під час створення доставки, замовлення все одно списує товари."""
+    monkeypatch.setattr(inventory, "hold_ttl", 0.01)
+    product = Product(name="SlowShipping", price=10.0, available_amount=5)
+
+    def create_shipping(*args):
+        time.sleep(0.02)
+        inventory.expire_holds()
+        return "shipping_1"
+
+    mock_repo = mocker.Mock()
+    mock_repo.create_shipping.side_effect = create_shipping
+    mock_repo.update_shipping_status.return_value = {"ResponseMetadata": {}}
+    service = ShippingService(mock_repo, mocker.Mock())
+    cart = ShoppingCart()
+    cart.add_product(product, 2)
+
+    due_date = datetime.now(timezone.utc) + timedelta(minutes=5)
+    assert Order(cart, service).place_order(service.list_available_shipping_type()[0], due_date) == "shipping_1"
+    assert product.available_amount == 3
+
+    def sell_out(*args):
+        time.sleep(0.02)
+        inventory.expire_holds()
+        product.buy(product.available_amount)
+        return "shipping_2"
+
+    mock_repo.create_shipping.side_effect = sell_out
+    cart.add_product(product, 1)
+    with pytest.raises(ValueError):
+        Order(cart, service).place_order(service.list_available_shipping_type()[0], due_date)
+    mock_repo.update_shipping_status.assert_called_with("shipping_2", service.SHIPPING_FAILED)
+    assert product.available_amount == 0
@@ -0,0 +1,79 @@
+import pytest
+
+from app.catalog import Catalog
+from app.eshop import ShoppingCart
+from app.journal import InventoryJournal
+
+
+def load_catalog():
+    return Catalog.from_columns(["Phone", "Laptop", "Case"], [500.0, 1500.0, 20.0], [10, 5, 100])
+
+
+def test_journal_recovers_stock_after_restart(tmp_path):
+    """Покупки й поповнення переживають перезапуск завдяки журналу."""
+    catalog = load_catalog()
+    journal = InventoryJournal(catalog, tmp_path, chunk_records=2)
+    journal.recover()
+
+    catalog["Phone"].buy(3)
+    catalog.restock({"Laptop": 2, "Case": 1})
+    cart = ShoppingCart()
+    cart.add_product(catalog["Case"], 11)
+    cart.submit_cart_order()
+    journal.close()
+
+    restarted = load_catalog()
+    with InventoryJournal(restarted, tmp_path) as reopened:
+        assert reopened.recover() == 4
+        assert list(restarted.amounts) == [7, 7, 90]
+
+        restarted["Phone"].buy(1)
+        assert len(reopened) == 5
+
+
+def test_snapshot_and_tail_replay(tmp_path):
+    """Відновлення читає знімок і доганяє його записами, зробленими після нього."""
+    catalog = load_catalog()
+    with InventoryJournal(catalog, tmp_path, snapshot_every=3) as journal:
+        journal.recover()
+        for _ in range(4):
+            catalog["Case"].buy(5)
+        assert len(journal) == 1
+        catalog["Phone"].buy(2)
+
+    restarted = load_catalog()
+    restarted.add("Charger", 15.0, 40)
+    with InventoryJournal(restarted, tmp_path) as journal:
+        assert journal.recover() == 2
+        assert list(restarted.amounts) == [8, 5, 80, 40]
+
+
+def test_torn_record_is_ignored(tmp_path):
+    """Недописаний запис у кінці журналу відкидається, а нові записи йдуть на його місце."""
+    catalog = load_catalog()
+    with InventoryJournal(catalog, tmp_path) as journal:
+        journal.recover()
+        catalog["Phone"].buy(1)
+        catalog["Phone"].buy(1)
+        torn_at = journal.HEADER.size + journal.RECORD.size + journal.BODY.size
+        journal._map[torn_at] ^= 0xFF
+
+    restarted = load_catalog()
+    with InventoryJournal(restarted, tmp_path) as journal:
+        assert journal.recover() == 1
+        assert restarted["Phone"].available_amount == 9
+        restarted["Laptop"].buy(1)
+
+    with InventoryJournal(load_catalog(), tmp_path) as journal:
+        assert journal.recover() == 2
+        assert list(journal.catalog.amounts) == [9, 4, 100]
+
+
+def test_journal_rejects_foreign_catalog(tmp_path):
+    """Журнал не застосовується до каталогу, в якому немає його товарів."""
+    with InventoryJournal(load_catalog(), tmp_path, snapshot_every=1) as journal:
+        journal.recover()
+        journal.catalog["Phone"].buy(1)
+
+    with pytest.raises(ValueError):
+        InventoryJournal(Catalog.from_columns(["Phone"], [500.0], [10]), tmp_path).recover()
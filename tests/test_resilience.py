@@ -0,0 +1,109 @@
+import pytest
+from botocore.exceptions import ClientError
+
+from services.resilience import CircuitBreaker, CircuitOpenError, ResiliencePolicy, TokenBucket
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def client_error(code, operation="PutItem"):
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+
+def flaky(errors, result="ok"):
+    errors = list(errors)
+
+    def operation():
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    return operation
+
+
+def test_policy_retries_throttling_and_slows_down():
+    """Тротлінг повторюється з відступом, а ліміт швидкості зменшується."""
+    clock = FakeClock()
+    policy = ResiliencePolicy("ShippingTable", rate=100, clock=clock, sleep=clock.sleep)
+    operation = flaky([client_error("ProvisionedThroughputExceededException")] * 2)
+
+    assert policy.call(operation) == "ok"
+
+    stats = policy.stats()
+    assert stats["retries"] == 2
+    assert stats["throttled"] == 2
+    assert stats["rate"] < 100
+    assert clock.now > 0
+
+
+def test_policy_does_not_retry_business_errors():
+    """Помилки умов не повторюються і не відкривають запобіжник."""
+    clock = FakeClock()
+    policy = ResiliencePolicy("ShippingTable", failure_threshold=1, clock=clock, sleep=clock.sleep)
+    calls = []
+
+    def operation():
+        calls.append(1)
+        raise client_error("ConditionalCheckFailedException", "UpdateItem")
+
+    with pytest.raises(ClientError):
+        policy.call(operation)
+    assert len(calls) == 1
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_circuit_opens_and_recovers():
+    """Після серії невдач виклики відхиляються одразу, а після паузи — пробний виклик."""
+    clock = FakeClock()
+    policy = ResiliencePolicy("ShippingQueue", max_attempts=2, failure_threshold=2, reset_timeout=10,
+                              clock=clock, sleep=clock.sleep)
+    failing = flaky([client_error("ServiceUnavailable", "SendMessage")] * 4)
+
+    for _ in range(2):
+        with pytest.raises(ClientError):
+            policy.call(failing)
+    with pytest.raises(CircuitOpenError):
+        policy.call(failing)
+    assert policy.stats()["rejected"] == 1
+
+    clock.now += 10
+    assert policy.call(failing) == "ok"
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_probe_failing_outside_aws_settles_the_circuit():
+    """Пробний виклик, що впав не з помилкою AWS, не залишає запобіжник напіввідкритим назавжди."""
+    clock = FakeClock()
+    policy = ResiliencePolicy("ShippingTable", max_attempts=1, failure_threshold=1, reset_timeout=10,
+                              clock=clock, sleep=clock.sleep)
+    with pytest.raises(ClientError):
+        policy.call(flaky([client_error("ServiceUnavailable")]))
+    assert policy.breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 10
+    with pytest.raises(KeyError):
+        policy.call(flaky([KeyError("shipping_id")]))
+
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+    assert policy.call(flaky([])) == "ok"
+
+
+def test_token_bucket_limits_rate():
+    """Токен-бакет пропускає не більше rate викликів за секунду після початкового запасу."""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, burst=5, clock=clock, sleep=clock.sleep)
+
+    for _ in range(25):
+        bucket.acquire()
+
+    assert clock.now == pytest.approx(2.0)